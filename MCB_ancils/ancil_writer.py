@@ -0,0 +1,201 @@
+# Write the emissions cube straight to a UM ancillary file, without
+# saving a pp-file and converting it with ancil_2anc.py.
+#
+# save_ancil() writes <name>.anc (a UM ancillary/FieldsFile, via mule,
+# the Met Office UM file library that ANTS itself uses) and <name>.anc.nc
+# (the netCDF copy for plotting that ancil_2anc.py also produces)
+# directly from the cube (or cubes: save_ancil_fields writes several
+# field types to one file). ANTS doesn't need to be installed, only
+# mule. The cubes may be lazy (e.g. region_mask.lazy_time_series):
+# each month is only computed as its field is written, to either file,
+# so only one month at a time is held in memory. The netCDF files are
+# zlib-compressed (with the shuffle filter) in chunks of one month; the
+# fields are mostly zeros, so this makes them many times smaller.
+#
+# Only regular global lat-lon grids are handled, which is all the MCB
+# ancillaries use. The default grid staggering is 6 (ENDGame), as in
+# "ancil_2anc.py --grid-staggering 6".
+
+import iris
+import numpy as np
+
+# mule is only needed for .anc output, so pp-only runs don't need it:
+try:
+    import mule
+except ImportError:
+    mule = None
+
+
+MDI = -1.0e30
+
+# UM calendar codes (fixed-length header) and the matching lbtim IC digit:
+_CALENDARS = {'360_day': (2, 2), 'gregorian': (1, 1), 'standard': (1, 1),
+              'proleptic_gregorian': (1, 1), '365_day': (4, 4), 'noleap': (4, 4)}
+
+
+def netcdf_options(cube):
+    """iris.save options for zlib/shuffle-compressed netCDF in monthly chunks."""
+    return dict(zlib=True, complevel=4, shuffle=True, chunksizes=(1,) + cube.shape[1:])
+
+
+def save_netcdf(cubes, ncfile):
+    """Save cubes on the same grid as compressed netCDF (see netcdf_options)."""
+    iris.save(iris.cube.CubeList(cubes), ncfile, **netcdf_options(cubes[0]))
+
+
+def _dates(cube):
+    time = cube.coord('time')
+    return time.units.num2date(time.points), time.units.calendar
+
+
+def _set_time(header, prefix, date):
+    for name in ('year', 'month', 'day', 'hour', 'minute', 'second'):
+        setattr(header, prefix + name, getattr(date, name))
+    setattr(header, prefix + 'year_day', date.dayofyr)
+
+
+def _ancil_file(cube, grid_staggering, periodic, nfields=1):
+    """Empty mule.AncilFile with headers for the cube's grid and times."""
+    lats = cube.coord('latitude').points
+    lons = cube.coord('longitude').points
+    dates, calendar = _dates(cube)
+    dlat = float(lats[1] - lats[0])
+    dlon = float(lons[1] - lons[0])
+
+    # For ENDGame the origin in the real constants is the grid corner,
+    # with the (theta) points half a gridbox in from it:
+    start_lat, start_lon = float(lats[0]), float(lons[0])
+    if grid_staggering == 6:
+        start_lat -= 0.5 * dlat
+        start_lon -= 0.5 * dlon
+
+    anc = mule.AncilFile.from_template({
+        'fixed_length_header': {
+            'data_set_format_version': 20,
+            'sub_model': 1,
+            'vert_coord_type': 1,
+            'horiz_grid_type': 0,
+            'dataset_type': 4,
+            'calendar': _CALENDARS[calendar][0],
+            'grid_staggering': grid_staggering,
+            'time_type': 2 if periodic else 1,
+        },
+        'integer_constants': {
+            'num_times': len(dates),
+            'num_cols': len(lons),
+            'num_rows': len(lats),
+            'num_levels': 1,
+            'num_field_types': nfields,
+        },
+        'real_constants': {
+            'col_spacing': dlon,
+            'row_spacing': dlat,
+            'start_lat': start_lat,
+            'start_lon': start_lon,
+            'north_pole_lat': 90.0,
+            'north_pole_lon': 0.0,
+        },
+    })
+    flh = anc.fixed_length_header
+    _set_time(flh, 't1_', dates[0])
+    _set_time(flh, 't2_', dates[-1])
+    # Time interval between fields (monthly):
+    for name in ('year', 'day', 'hour', 'minute', 'second', 'year_day'):
+        setattr(flh, 't3_' + name, 0)
+    flh.t3_month = 1 if len(dates) > 1 else 0
+    return anc
+
+
+class _MonthProvider(object):
+    """mule data provider for month t of a cube, computed (as 32-bit
+    floats, the precision of the template) only when mule writes it."""
+
+    def __init__(self, cube, t):
+        self.cube = cube
+        self.t = t
+
+    def _data_array(self):
+        return np.ma.filled(self.cube[self.t].data, MDI).astype('f4')
+
+
+def _field(cube, t, date, stash):
+    """mule.Field3 for month t of the cube, valid at date."""
+    lats = cube.coord('latitude').points
+    lons = cube.coord('longitude').points
+    calendar = cube.coord('time').units.calendar
+
+    # Validity and data times are the same for ancillary fields:
+    field = mule.Field3.empty()
+    field.lbyr, field.lbmon, field.lbdat = date.year, date.month, date.day
+    field.lbhr, field.lbmin, field.lbsec = date.hour, date.minute, date.second
+    field.lbyrd, field.lbmond, field.lbdatd = date.year, date.month, date.day
+    field.lbhrd, field.lbmind, field.lbsecd = date.hour, date.minute, date.second
+    field.lbtim = _CALENDARS[calendar][1]
+    field.lbft = 0
+    field.lbcode = 1
+    field.lbhem = 0
+    field.lbrow = len(lats)
+    field.lbnpt = len(lons)
+    field.lbext = 0
+    field.lbpack = 0
+    field.lbrel = 3
+    field.lbfc = 0
+    field.lbproc = 0
+    field.lbvc = 129
+    field.lblev = 9999
+    field.lbuser1 = 1
+    field.lbuser4 = stash
+    field.lbuser7 = 1
+    field.blev = 0.0
+    field.bplat = 90.0
+    field.bplon = 0.0
+    field.bdy = float(lats[1] - lats[0])
+    field.bzy = float(lats[0]) - field.bdy
+    field.bdx = float(lons[1] - lons[0])
+    field.bzx = float(lons[0]) - field.bdx
+    field.bmdi = MDI
+    field.bmks = 1.0
+    field.set_data_provider(_MonthProvider(cube, t))
+    return field
+
+
+def save_ancil(cube, ancfile, stash=301, grid_staggering=6, periodic=False, netcdf=True):
+    """Write a (time, lat, lon) cube as a UM ancillary, plus <ancfile>.nc.
+
+    The cube may be lazy; each month is computed as mule writes its
+    field, and again as iris writes it to the netCDF copy.
+    """
+    save_ancil_fields([cube], ancfile, [stash], grid_staggering, periodic, netcdf)
+
+
+def save_ancil_fields(cubes, ancfile, stashes, grid_staggering=6, periodic=False, netcdf=True):
+    """Write several (time, lat, lon) cubes on the same grid and times as
+    one UM ancillary with a field type per cube, plus <ancfile>.nc.
+
+    The cubes may be lazy; each month is only computed as its field is
+    written (see save_ancil), so no more than one month of each is held
+    in memory at a time.
+    """
+    if mule is None:
+        raise ImportError('writing .anc files needs mule (e.g. "module load ants" '
+                          'or "conda install -c conda-forge mule")')
+    dates, _ = _dates(cubes[0])
+    anc = _ancil_file(cubes[0], grid_staggering, periodic, len(cubes))
+    # All the field types for each time in turn, as the UM reads them:
+    for t, date in enumerate(dates):
+        for cube, stash in zip(cubes, stashes):
+            anc.fields.append(_field(cube, t, date, stash))
+    anc.to_file(ancfile)
+    if netcdf:
+        save_netcdf(cubes, ancfile + '.nc')
+
+
+def save(cube, opfile, **kwargs):
+    """Save to a UM ancillary if opfile ends in .anc, otherwise with
+    iris.save (compressed if opfile ends in .nc)."""
+    if opfile.endswith('.anc'):
+        save_ancil(cube, opfile, **kwargs)
+    elif opfile.endswith('.nc'):
+        save_netcdf([cube], opfile)
+    else:
+        iris.save(cube, opfile)
@@ -0,0 +1,152 @@
+# Region basis fields: one unit emission field per region, so that any
+# scenario on those regions is a linear combination of them.
+#
+# => python3 basis.py build basis_R1-16.npz
+# => python3 basis.py field basis_R1-16.npz NO_50Tg_MCB.pp --tgyr 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 50
+#
+# Region r's unit field is the emission field (kg m-2 s-1) that emits
+# 1 Tg/yr in region r and nothing elsewhere, with the overlap policy and
+# ocean weights of the regions it's built from: the basis is just the
+# regions' rate solver (see mcb_ancil.build_regions and rate_solver.py),
+# whose (point, region, weight) entries and region areas are saved
+# compressed: R1-R16 on N96 take around 25 KB, against 1.3 MB for each
+# scenario's pp-file. A scenario is then just a vector of Tg/yr per
+# region, and its field comes from one sparse solve (a whole stack of
+# scenarios at once, if wanted), with its global total equal to the sum
+# of the vector by construction.
+#
+# The basis file also records what it was built from: the regions (as
+# selected, and the boxes or polygons they were then), the overlap
+# policy, the ocean threshold and a hash of the grid and land fraction.
+# "field" checks these against the current template, land fraction and
+# region definitions, and refuses a stale basis (e.g. after editing
+# regions.py or changing the land fraction) rather than silently using it.
+
+import argparse
+import collections
+import json
+
+import numpy as np
+
+import grid_cache
+import mcb_ancil
+import rate_solver
+import region_config
+import region_index
+
+
+# solver is the regions' rate_solver.Solver, metadata a JSON-able dict
+# of what it was built from (see basis_metadata).
+Basis = collections.namedtuple('Basis', ['solver', 'metadata'])
+
+
+def basis_metadata(grid, selection, config=None, overlap='first', ocean_threshold=None,
+                   landfile=mcb_ancil.LANDFILE):
+    """What a basis on grid for these regions (see mcb_ancil.select_regions) depends on."""
+    regions = mcb_ancil.resolve_regions(mcb_ancil.select_regions(selection, config))
+    return {'selection': list(selection or []), 'config': config,
+            'regions': [region_config.cache_name(r) for r in regions],
+            'overlap': overlap, 'ocean_threshold': ocean_threshold,
+            'grid': grid_cache.grid_key([grid.lats, grid.lons], landfile)}
+
+
+def make_basis(grid, selection, config=None, overlap='first', ocean_threshold=None,
+               landfile=mcb_ancil.LANDFILE):
+    """Unit fields (kg m-2 s-1 per Tg/yr) for the regions picked by selection.
+
+    grid must have been loaded with this landfile and ocean_threshold.
+    """
+    regions = mcb_ancil.select_regions(selection, config)
+    solver = mcb_ancil.build_regions(grid, regions, overlap)
+    return Basis(solver, basis_metadata(grid, selection, config, overlap, ocean_threshold, landfile))
+
+
+def check_basis(basis, grid, landfile=mcb_ancil.LANDFILE):
+    """Raise ValueError if basis wasn't built from grid, landfile and the current regions."""
+    meta = basis.metadata
+    current = basis_metadata(grid, meta['selection'], meta['config'], meta['overlap'],
+                             meta['ocean_threshold'], landfile)
+    stale = [what for name, what in (('grid', 'grid or land fraction'), ('regions', 'region definitions'))
+             if current[name] != meta[name]]
+    if stale:
+        raise ValueError('the basis was built from a different {} (overlap {}, ocean threshold {}); '
+                         'rebuild it'.format(' and '.join(stale), meta['overlap'], meta['ocean_threshold']))
+
+
+def scenario_field(basis, coefficients):
+    """Emission field(s) for coefficients in Tg/yr per region.
+
+    coefficients has shape (nregions,) for one (lat, lon) field, or
+    (nvectors, nregions) for a (nvectors, lat, lon) stack of them; a
+    single total is shared at equal flux (see mcb_ancil.region_targets).
+    """
+    return mcb_ancil.compute_field(basis.solver, coefficients)
+
+
+def save_basis(basis, path):
+    """Save a basis (compressed .npz)."""
+    solver = basis.solver
+    np.savez_compressed(path, shape=np.asarray(solver.shape), support=solver.support.astype('i4'),
+                        indptr=solver.indptr.astype('i4'), regions=solver.regions.astype('i2'),
+                        weights=solver.weights, areas=solver.areas,
+                        metadata=np.array(json.dumps(basis.metadata)))
+
+
+def load_basis(path):
+    """Load a basis saved by save_basis."""
+    with np.load(path) as f:
+        solver = rate_solver.Solver(tuple(f['shape']), f['support'], f['indptr'], f['regions'],
+                                    f['weights'], f['areas'])
+        return Basis(solver, json.loads(str(f['metadata'])))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build region basis fields, or a scenario from them.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help='build and save the basis fields')
+    build.add_argument('basisfile', help='output .npz file')
+    build.add_argument('--regions', nargs='+',
+                       help='region numbers (default R1-R16), or numbers or names in --config')
+    build.add_argument('--config', help='JSON/YAML/GeoJSON region file')
+    build.add_argument('--overlap', default='first', choices=region_index.OVERLAP_POLICIES,
+                       help='how points in more than one region are counted')
+    build.add_argument('--ocean-threshold', type=float,
+                       help='weight by ocean fraction, keeping points with more ocean than this')
+    field = commands.add_parser('field', help='write the field for a scenario')
+    field.add_argument('basisfile', help='.npz file from "build"')
+    field.add_argument('opfile', help='output file (.pp, or .anc for a UM ancillary)')
+    field.add_argument('--tgyr', type=float, nargs='+', required=True,
+                       help='total Tg/yr (equal flux) or one amount per region')
+    for command in (build, field):
+        command.add_argument('--infile', default=mcb_ancil.INFILE, help='template pp-file')
+        command.add_argument('--landfile', default=mcb_ancil.LANDFILE, help='land-fraction pp-file')
+        command.add_argument('--cachedir', help='cache grid areas and masks here between runs')
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        grid = mcb_ancil.load_grid(args.infile, args.landfile, args.cachedir, args.ocean_threshold)
+        selection = args.regions
+        if selection is None and args.config is None:
+            selection = [str(r) for r in range(1, len(mcb_ancil.rs) + 1)]
+        basis = make_basis(grid, selection, args.config, args.overlap, args.ocean_threshold, args.landfile)
+        save_basis(basis, args.basisfile)
+        print('{}: {} regions, {} entries'.format(args.basisfile, len(basis.solver.areas),
+                                                  len(basis.solver.weights)))
+    else:
+        basis = load_basis(args.basisfile)
+        grid = mcb_ancil.load_grid(args.infile, args.landfile, args.cachedir,
+                                   basis.metadata['ocean_threshold'])
+        try:
+            check_basis(basis, grid, args.landfile)
+        except ValueError as e:
+            parser.error('{}: {}'.format(args.basisfile, e))
+        coefficients = mcb_ancil.region_targets(basis.solver, args.tgyr)
+        field = scenario_field(basis, coefficients)
+        total = mcb_ancil.total_tgyr(grid, field)
+        rate_solver.check_total(total, coefficients)
+        mcb_ancil.write_ancil(grid, field, args.opfile)
+        print('{}: total (Tg[sea-salt]/yr) = {:.4f}'.format(args.opfile, total))
+
+
+if __name__ == '__main__':
+    main()
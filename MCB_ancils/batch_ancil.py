@@ -0,0 +1,263 @@
+# Batch mode for bdd_ancil.py: build many MCB ancillaries in one run.
+#
+# The grid (see mcb_ancil.load_grid) and template cube are loaded once and
+# shared by every scenario, instead of rerunning bdd_ancil.py (and
+# reloading everything) per output file.
+#
+# => python3 batch_ancil.py scenarios.csv
+#
+# scenarios.csv has a header line and one row per output file:
+#
+#    opfile,regions,tgyr
+#    NO_50Tg_MCB.pp,16,50
+#    SEP_50Tg_MCB.pp,2,50
+#    mixed.pp,1 2 3,10 20 5
+#
+# "regions" are region numbers from regions.py, separated by spaces.
+# "tgyr" is either a single total in Tg/yr, spread at equal flux over all
+# the selected regions (as bdd_ancil.py does), or one amount per region
+# in Tg/yr (as create_ancil.py does). By default a grid point only counts
+# towards the first selected region that contains it, so overlaps aren't
+# double counted either way; --overlap chooses another policy (see
+# region_index.py).
+#
+# Points are in a region only if they're all ocean (land fraction 0);
+# --ocean-threshold T instead weights the emissions by ocean fraction,
+# keeping points with more than T of ocean (see region_mask.py).
+#
+# Three optional columns give a time-varying schedule (see schedule.py):
+#
+#    opfile,regions,tgyr,seasonal,years,ramp
+#    ramped.pp,16,50,,30,0 50
+#    seasonal.pp,1 2,10 20,1 1 2 3 4 4 4 3 2 1 1 1,,
+#
+# "seasonal" is 12 monthly factors (Jan-Dec), rescaled so each year still
+# emits tgyr; "years" repeats the template year that many times; "ramp" is
+# the "start end" factor on tgyr in the first and last year. Without them
+# every month gets the same field, as before.
+#
+# Each .pp file still needs converting with ancil_2anc.py (see bdd_ancil.py);
+# give opfile a .anc suffix instead to write the UM ancillary (and .anc.nc)
+# directly (see ancil_writer.py).
+# --reference DIR checks each .pp output against a reference file of the
+# same name there (see validate.py), and the exit status is 1 if any differ.
+# Outputs are written atomically and recorded, with the definition they
+# were built from, in a manifest in the output directory (see
+# output_store.py); --resume skips outputs already built from the same
+# definition by an earlier (e.g. interrupted) run.
+# For big tables, parallel_ancil.py runs the same thing on a process pool.
+
+import argparse
+import collections
+import csv
+import os
+import sys
+import warnings
+
+import iris
+import numpy as np
+
+import ancil_writer
+import instrument
+import mcb_ancil
+import output_store
+import rate_solver
+import region_index
+import region_mask
+import schedule
+import validate
+from mcb_ancil import INFILE, LANDFILE
+from rate_solver import SECS_PER_YEAR
+
+
+warnings.filterwarnings("ignore", category=UserWarning, message="Collapsing a non-contiguous coordinate.")
+warnings.filterwarnings("ignore", category=UserWarning, message="Unable to create instance of HybridHeightFactory.")
+warnings.filterwarnings("ignore", category=UserWarning, message="has_year_zero kwarg ignored for idealized calendars")
+
+Scenario = collections.namedtuple('Scenario', ['opfile', 'rsel', 'tgyr', 'seasonal', 'years', 'ramp'],
+                                  defaults=(None, 1, None))
+
+
+# Template cube of each template file, loaded once (see template_cube):
+_cubes = {}
+
+
+def template_cube(grid):
+    """The grid's template as an iris cube set up for the emissions.
+
+    Loaded on first use and then shared by every scenario (and, if it's
+    loaded before the pool starts, by parallel_ancil.py's workers).
+    """
+    if grid.template.path not in _cubes:
+        _cubes[grid.template.path] = mcb_ancil.template_cube(grid.template.path)
+    return _cubes[grid.template.path]
+
+
+def read_scenarios(path):
+    """Read a scenario table (see top of file) into a list of Scenarios."""
+    scenarios = []
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            rsel = [int(r) for r in row['regions'].split()]
+            tgyr = [float(t) for t in row['tgyr'].split()]
+            if len(tgyr) not in (1, len(rsel)):
+                raise ValueError('{}: need one total or one amount per region, '
+                                 'got {} amounts for {} regions'
+                                 .format(row['opfile'], len(tgyr), len(rsel)))
+            seasonal = [float(f) for f in (row.get('seasonal') or '').split()] or None
+            years = int(row.get('years') or 1)
+            ramp = [float(f) for f in (row.get('ramp') or '').split()] or None
+            if ramp is not None and len(ramp) != 2:
+                raise ValueError('{}: ramp needs a start and end factor, got {}'
+                                 .format(row['opfile'], row['ramp']))
+            scenarios.append(Scenario(row['opfile'].strip(), rsel, tgyr, seasonal, years, ramp))
+    return scenarios
+
+
+def scenario_solver(grid, rsel, tgyr, overlap='first'):
+    """Rate solver for the selected regions and per-region targets (Tg/yr)."""
+    solver = mcb_ancil.build_regions(grid, rsel, overlap)
+    return solver, mcb_ancil.region_targets(solver, tgyr)
+
+
+def scenario_field(grid, rsel, tgyr, overlap='first'):
+    """2-D emission field (kg m-2 s-1) and per-region targets (Tg/yr)."""
+    solver, targets = scenario_solver(grid, rsel, tgyr, overlap)
+    return rate_solver.solve(solver, targets), targets
+
+
+def scheduled_cube(grid, solver, targets, scenario):
+    """Copy of the template cube, extended to scenario.years, with the
+    scenario's seasonal cycle and ramp applied to the targets.
+
+    The data is lazy, one chunk per month, so iris.save computes and
+    writes it month by month whatever the length of the run.
+    """
+    template = template_cube(grid)
+    if scenario.years > 1:
+        template = schedule.extend_cube(template, scenario.years)
+    factors = schedule.time_factors(schedule.cube_months(template), len(targets),
+                                    scenario.seasonal, scenario.ramp)
+    data = schedule.lazy_fields(solver, targets, factors, template.dtype)
+    return template.copy(data=data)
+
+
+def scenario_cube(grid, field, lazy=True):
+    """Copy of the template cube with the field in every month.
+
+    By default the data is a lazy broadcast of the 2-D field, so the full
+    (time, lat, lon) array is never held in memory; iris.save computes it
+    one field at a time.
+    """
+    template = template_cube(grid)
+    if lazy:
+        data = region_mask.lazy_time_series(field, template.shape, template.dtype)
+    else:
+        data = np.empty(template.shape, dtype=template.dtype)
+        region_mask.fill_time_series(data, field)
+    return template.copy(data=data)
+
+
+def total_tgyr(grid, cube, months=1):
+    """Global total (Tg/yr) of an emissions cube, averaged over its first
+    months (12 for the annual mean of a seasonal cube)."""
+    weights = np.broadcast_to(grid.grid_areas, (months,) + grid.grid_areas.shape)
+    total = cube[:months].collapsed(['time', 'longitude', 'latitude'], iris.analysis.SUM,
+                                    weights=weights).data
+    return float(total) / months * SECS_PER_YEAR * 1e-9
+
+
+def yearly_totals(grid, cube):
+    """Total (Tg/yr) of each year (run of 12 months, as in schedule.py) of
+    an emissions cube."""
+    ntimes = cube.shape[0]
+    return [total_tgyr(grid, cube[start:], min(12, ntimes - start)) for start in range(0, ntimes, 12)]
+
+
+def build_scenario(grid, scenario, outdir='.', overlap='first', sweep=None, resume=False):
+    """Build and save one scenario.
+
+    The output is always written atomically (see output_store.py). With
+    a sweep (an output_store.Sweep of the run's other settings and input
+    files) it's also recorded in the output directory's manifest, and
+    with resume as well, a scenario already built from the same
+    definition is skipped.
+
+    Returns the output path, total emissions (Tg/yr), injection area
+    (m2) and whether the output was written (False if skipped).
+    """
+    def write(opfile):
+        solver, targets = scenario_solver(grid, scenario.rsel, scenario.tgyr, overlap)
+        field = rate_solver.solve(solver, targets)
+        if scenario.seasonal is None and scenario.years == 1 and scenario.ramp is None:
+            cube = scenario_cube(grid, field)
+            total = total_tgyr(grid, cube)
+            rate_solver.check_total(total, targets)
+        else:
+            cube = scheduled_cube(grid, solver, targets, scenario)
+            # Each year emits the targets times that year's ramp factor:
+            totals = yearly_totals(grid, cube)
+            ramp = schedule.ramp_factors(len(totals), *(scenario.ramp or (1.0, 1.0)))
+            for year_total, factor in zip(totals, ramp):
+                rate_solver.check_total(year_total, factor * np.asarray(targets))
+            total = totals[0]
+        ancil_writer.save(cube, opfile)
+        return {'total': total, 'area': float(np.sum(grid.grid_areas, where=field != 0))}
+
+    opfile = os.path.join(outdir, scenario.opfile)
+    if sweep is None:
+        with output_store.atomic_output(opfile) as tmpfile:
+            info = write(tmpfile)
+        written = True
+    else:
+        definition = dict(sweep.settings, overlap=overlap, **scenario._asdict())
+        info, written = output_store.build(outdir, scenario.opfile, definition, sweep.files, write,
+                                           skip=resume)
+    return opfile, info['total'], info['area'], written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build MCB emission ancillaries from a scenario table.')
+    parser.add_argument('table', help='CSV scenario table (opfile,regions,tgyr)')
+    parser.add_argument('--infile', default=INFILE, help='template pp-file')
+    parser.add_argument('--landfile', default=LANDFILE, help='land-fraction pp-file')
+    parser.add_argument('--outdir', default='.', help='directory for the output files')
+    parser.add_argument('--cachedir', help='cache grid areas and masks here between runs')
+    parser.add_argument('--overlap', default='first', choices=region_index.OVERLAP_POLICIES,
+                        help='how points in more than one region are counted')
+    parser.add_argument('--ocean-threshold', type=float,
+                        help='weight by ocean fraction, keeping points with more ocean than this')
+    parser.add_argument('--timings', metavar='JSON',
+                        help='print stage timings and memory use, and save them as JSON here')
+    parser.add_argument('--reference', metavar='DIR',
+                        help='check each .pp output against the file of the same name here')
+    parser.add_argument('--resume', action='store_true',
+                        help='skip outputs already built from the same definition (see output_store.py)')
+    args = parser.parse_args(argv)
+
+    instrument.begin('batch_ancil.py', trace=args.timings is not None, **vars(args))
+    scenarios = read_scenarios(args.table)
+    with instrument.stage('load_grid'):
+        grid = mcb_ancil.load_grid(args.infile, args.landfile, args.cachedir, args.ocean_threshold)
+    sweep = output_store.make_sweep(args.infile, args.landfile, ocean_threshold=args.ocean_threshold)
+    failed = 0
+    for scenario in scenarios:
+        with instrument.stage(scenario.opfile):
+            opfile, total, area, written = build_scenario(grid, scenario, args.outdir, args.overlap,
+                                                          sweep, args.resume)
+        print('{}: area (million km2) = {:.4f}, total (Tg[sea-salt]/yr) = {:.4f}{}'
+              .format(opfile, area * 1e-12, total, '' if written else ' (already built)'))
+        if args.reference is not None and opfile.endswith('.pp'):
+            reffile = os.path.join(args.reference, os.path.basename(opfile))
+            with instrument.stage('validate ' + scenario.opfile):
+                ok, _, problems = validate.validate(opfile, reffile)
+            for problem in problems:
+                print('  ' + problem)
+            failed += not ok
+    if args.timings is not None:
+        instrument.report(args.timings)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
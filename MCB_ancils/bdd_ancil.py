@@ -4,9 +4,10 @@
 #2. in this file, change opfile, rsel & totalems for region and amount Tg/yr
 #3. python3 bdd_ancil.py
 #4. "ancil_2anc.py --output <ancillary_file_name.anc> --grid-staggering 6 <pp_file_name.pp>" in command line
+#   (or give opfile a .anc suffix to write the .anc & .anc.nc directly and skip step 4)
 #5. From local terminal, scp [jasmin server]:'[path to file]' [monsoon server/etc]:'[path to folder]/.'
 
-#bdd: region select (scroll down to R1-R15 for defined regions)
+#bdd: region select (see regions.py for defined regions R1-R16)
 #Put in as list in case you want multiple regions
 #rsel=[16]
 rsel=list(range(1, 17)) #for activating all regions
@@ -16,12 +17,43 @@ numreg=len(rsel) #number of regions selected
 # Define output filename:
 # ======================
 opfile = 'test2.pp'
+#bdd: directory for caching grid areas & ocean weights between runs (None to switch off)
+cachedir = None
+#bdd: None keeps only all-ocean points (land fraction exactly 0); a number instead
+#weights emissions by ocean fraction (1 - land fraction), dropping points whose
+#ocean fraction is that or less (0.0 keeps every point with some ocean)
+ocean_threshold = None
+#bdd: print how long each stage takes & how much memory it uses (see instrument.py);
+#give timings_file a name to also save that as JSON
+print_timings = False
+timings_file = None
+#bdd: WGDOS-pack the pp-file (see wgdos.py) keeping this many bits of the field's
+#largest value, e.g. 24 (~7x smaller; every value within ~1e-7 of the largest, so
+#smaller values may change slightly); None leaves it unpacked.
+#A .nc opfile is written as compressed netCDF.
+wgdos_bits = None
+#bdd: skip the run if opfile was already made by this script with these same settings
+#and input files (see output_store.py); with resume, opfile is recorded for that in
+#manifest.json (and manifest.json.lock) next to it. Either way opfile is written
+#atomically, so an interrupted save never leaves a truncated file
+resume = False
+
+import os
+import sys
+import warnings
 
-import cf_units
-import iris
-import iris.analysis.cartography as iac
 import numpy as np
-import warnings
+
+import instrument
+instrument.begin('bdd_ancil.py', trace=print_timings or timings_file is not None,
+                 rsel=rsel, totalems=totalems, opfile=opfile, ocean_threshold=ocean_threshold)
+instrument.mark('imports')
+
+#bdd: the template & land fraction are read directly (see pp_template.py);
+#iris (and mule) are only needed to write .anc or .nc files
+import mcb_ancil
+import output_store
+import rate_solver
 
 # Set values for output directory ("dir", ending in a slash) and 
 # output filename ("opfile", ending ".pp"). Then set the emission
@@ -49,62 +81,10 @@ dir = '~/MCB_ancils/'
 
 
 
-# Define region limits [W, S, E, N]
-# =================================
-# All longitudes are specified in degrees East.
-
-# R1 (North-East Pacfic): 
-R1 = [210, 0, 250, 30]
-
-# R2 (South-East Pacific): 
-R2 = [250, -30, 290, 0]
-
-# R3 (North Pacific): 
-R3 = [170, 30, 240, 50]
-
-# R4 (South Pacific): 
-R4 = [190, -50, 270, -30]
-
-# R5-6 (South-East Atlantic - straddles the Greenwich meridian):
-R5 = [335, -30, 359.5, 0]
-R6 = [0.5, -30, 15, 0]
-
-# R7 (Western North Pacific):
-R7 = [140, 30, 210, 50]
-
-# R8 (North-West Pacific)
-R8 = [120, 0, 160, 30]
-
-# R9 (South-West Pacific)
-R9 = [150, -30, 190, 0]
-
-# R10-11 (South Atlantic - straddles the Greenwich meridian):
-R10 = [305, -50, 359.5, -30]
-R11 = [0.5, -50, 15, -30]
-
-# R12 (North-West Atlantic)
-R12 = [290, 0, 335, 30]
-
-# R13 (North Atlantic)
-R13 = [290, 30, 360, 50]
-
-# R14 (South-East Indian Ocean)
-R14 = [70, -30, 110, 0]
-
-# R15 (Northern Indian Ocean)
-R15 = [45, 0, 100, 30]
-
-# R16 (Northern Oceans - extended):
-R16 = [0, 50, 359.5, 80]
-
-#Redo so you can just pick a region out of an array
+# Regions R1-R16 are defined in regions.py (rsel picks them by number)
 #bdd
-rs=[R1,R2,R3,R4,R5,R6,R7,R8,R9,R10,R11,R12,R13,R14,R15,R16]
-regsel=[rs[i-1] for i in rsel]
 rates=np.zeros((numreg,1))
 areas=np.zeros((numreg,1))
-rlats=[]
-rlons=[]
 
 #-----------------------------------------------------------------------------------------
 # Read in a field of surface temperature to use as a pattern
@@ -113,59 +93,33 @@ rlons=[]
 #ss_emiss = iris.load_cube(infile, iris.AttributeConstraint(STASH='m01s52i024'))
 #infile = '/data/users/hadna/Controller/MCB/mod_seasalt_test/cp109a.pm_2040_jan_to_dec_00024.pp'
 infile = 'cp109a.pm_2040_jan_to_dec_00024.pp'
-ss_emiss = iris.load_cube(infile, iris.AttributeConstraint(STASH='m01s00i024'))
-
-
-# Zero the data:
-ss_emiss.data[:,:,:] = 0.0          # Dimensions are [time, lat, lon]
-
-
-# Set STASH code to that for 2D user ancil:
-ss_emiss.attributes['STASH'] = iris.fileformats.pp.STASH(1, 00, 301)
-
-
-# Change its name:
-ss_emiss.rename('Sea-salt emissions')
-
-
-# Set the units:
-ss_emiss.units = cf_units.Unit('kg m-2 s-1')
-
-
-# Get lats and lons (as "DimCoord" thingies):
-lats = ss_emiss.coord('latitude')
-lons = ss_emiss.coord('longitude')
-
+landfile = 'aw310a.land_fraction.pp'
 
-# Get gridbox areas (as 2-D numpy array):
-cube = ss_emiss[0].copy()
-if not cube.coord('latitude').has_bounds():
-   cube.coord('latitude').guess_bounds()
-if not cube.coord('longitude').has_bounds():
-   cube.coord('longitude').guess_bounds()
-grid_areas = iac.area_weights(cube)
-#bdd, make array to check if a grid area has already been used
-#alternate way to avoid overlap
-#I would just zero out the grid_area but it would mess up validation later
-overlap = np.ones(np.shape(grid_areas))
+#bdd: everything the output depends on, for the manifest (with resume):
+outdir, opname = os.path.split(opfile)
+outdir = outdir or '.'
+definition = dict(rsel=rsel, totalems=totalems, ocean_threshold=ocean_threshold, wgdos_bits=wgdos_bits)
+if resume:
+   key = output_store.scenario_key(definition, [infile, landfile])
+   if output_store.is_done(outdir, opname, key) is not None:
+      print(opfile + ': already built with these settings, skipping')
+      sys.exit()
 
+#bdd: template headers, gridbox areas & ocean weights (see mcb_ancil.py), reused
+#from a previous run on the same grid if cached
+instrument.mark('template')
+grid = mcb_ancil.load_grid(infile, landfile, cachedir, ocean_threshold)
 
-# Get land-fraction field:
-landfile = 'aw310a.land_fraction.pp'
-land_frac = iris.load_cube(landfile)
 
-
-# Get indices of points in regions and associated areas:
+# Get masks of ocean points in regions and associated areas:
 #bdd
-for k in range(0,numreg):
-    rlats.append(np.where((lats.points >= regsel[k][1]) & (lats.points <= regsel[k][3]))[0])
-    rlons.append(np.where((lons.points >= regsel[k][0]) & (lons.points <= regsel[0][2]))[0])
-    for i in rlats[k]:
-        for j in rlons[k]:
-            if land_frac.data[i, j] == 0.0:
-                areas[k] = areas[k] + ((grid_areas[i, j])*(overlap[i, j]))
-                #Set to zero so that the next the index is hit, it doesn't contribute to area
-                overlap[i, j] = 0.0
+#a grid point only counts towards the area of the first region that hits it,
+#so overlapping regions (R3/R7) aren't double counted (see region_index.py
+#for the other ways of handling overlaps)
+#all the region masks are made in one go, each with its own [W, S, E, N]
+instrument.mark('regions')
+solver = mcb_ancil.build_regions(grid, rsel, overlap='first')
+areas[:, 0] = solver.areas
 #bdd
 #now that we have area, calculate emission rate
 #I'm assuming we want equal emissions in all regions?
@@ -180,25 +134,19 @@ print(areatot)
 # Insert the required injection amount in the appropriate areas:
 # NOTE that region R7 (Western North Pacific) partially overlaps
 #      region R3 (North Pacific)
-#bdd, ^ this is what I added overlap catch for.  My way is a little inefficient\# in that it still loops through every grid point and will just overwrite 
-#a grid point it's already hit.
-#this is ok because I set the code to make every region to have the same rate 
-#(rate * area = desired total emission)
-#probably a problem if you want different rates for different regions: 
-#if problem: just use Andy Jones' original code create_ancil.py
-for k in range(0,numreg):
-    for i in rlats[k]:
-        for j in rlons[k]:
-            if land_frac.data[i, j] == 0.0:
-                ss_emiss.data[:, i, j] = rates[k]
+#the index gives each shared point the rate of the region its area went to,
+#so rate * area adds up to the desired total emission
+#(for a different Tg/yr in each region give one amount per region, as in batch_ancil.py)
+instrument.mark('fill')
+field = mcb_ancil.compute_field(solver, totalems)
 #end bdd
 
-# Calculate global total using data from a single month (they're all the same):
-ss_emiss_total = ss_emiss[0].collapsed(['longitude','latitude'],iris.analysis.SUM, weights=grid_areas).data
-
+# Calculate global total (Tg/yr) using the field (the same every month):
+instrument.mark('total')
+ss_emiss_Tg_yr = mcb_ancil.total_tgyr(grid, field)
 
-# Convert from kg/s to Tg/yr for printout purposes:
-ss_emiss_Tg_yr = ss_emiss_total *60.*60.*24.*360.*1e-9
+#bdd: check it adds up to what was asked for
+rate_solver.check_total(ss_emiss_Tg_yr, totalems)
 
 
 # Print out total area used for injection:
@@ -215,4 +163,13 @@ print('Total emissions (Tg[sea-salt]/yr) = '+str(ss_emiss_Tg_yr))
 print('  ')
 
 # Save emissions to the specified output file (if desired):
-iris.save(ss_emiss, opfile)
+# (a .anc opfile is written as a UM ancillary, plus .anc.nc)
+instrument.mark('save')
+with output_store.atomic_output(opfile) as tmpfile:
+   mcb_ancil.write_ancil(grid, field, tmpfile, wgdos_bits=wgdos_bits)
+if resume:
+   output_store.record(outdir, opname, key, definition, {'total': float(ss_emiss_Tg_yr)})
+
+#bdd: how long it all took
+if print_timings or timings_file is not None:
+   instrument.report(timings_file, quiet=not print_timings)
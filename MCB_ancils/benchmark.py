@@ -0,0 +1,185 @@
+# Benchmarks of the ancillary-generation stages across grid sizes and
+# numbers of regions.
+#
+# => python3 benchmark.py
+# => python3 benchmark.py --grids 96 216 --regions 1 16 128 --repeat 3
+#
+# Everything runs on synthetic data, so only the template pp-file is
+# needed (for its headers): for each UM resolution N (ENDGame grid,
+# 1.5N x 2N points) a template pp-file with its 12 monthly headers on
+# that grid and a land fraction with fractional coasts are made up,
+# along with the given numbers of random region boxes. Each stage of bdd_ancil.py/create_ancil.py is then timed:
+#
+#   load       read the template headers (pp_template.load_template)
+#   areas      gridbox areas (pp_template.area_weights)
+#   masks      ocean weights and region points (region_mask.py)
+#   index      region index and area sums (region_index.py)
+#   fill       solve for the field and fill every month (rate_solver.py)
+#   total      global total of one month
+#   save       write the pp-file (pp_template.save_pp)
+#
+# and, if iris is installed, iris_load/iris_save for the cube route.
+# For each stage the best wall time over --repeat runs and the peak
+# memory it allocated (tracemalloc, which sees numpy arrays) are printed.
+
+import argparse
+import contextlib
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import mcb_ancil
+import pp_template
+import rate_solver
+import region_index
+import region_mask
+
+try:
+    import iris
+except ImportError:
+    iris = None
+
+
+GRIDS = (96, 216, 512, 1280)
+REGIONS = (1, 16, 128)
+
+
+def grid_shape(n):
+    """(nlat, nlon) of the N<n> ENDGame grid."""
+    return 3 * n // 2, 2 * n
+
+
+def synthetic_template(n, infile=mcb_ancil.INFILE):
+    """Template (see pp_template.py) with the monthly fields of infile on grid N<n>.
+
+    The lookup headers are infile's, with only the grid (LBROW, LBNPT,
+    BDY, BDX and the origins BZY, BZX) changed and the data unpacked
+    (LBPACK, LBLREC), so iris reads a template written from it as it
+    reads infile.
+    """
+    nlat, nlon = grid_shape(n)
+    template = pp_template.load_template(infile)
+    ints, reals = template.ints.copy(), template.reals.copy()
+    ints[:, pp_template.LBROW] = nlat
+    ints[:, pp_template.LBNPT] = nlon
+    ints[:, pp_template.LBPACK] = 0
+    ints[:, pp_template.LBLREC] = nlat * nlon
+    reals[:, pp_template.BDY] = 180.0 / nlat
+    reals[:, pp_template.BZY] = -90.0 - 0.5 * reals[0, pp_template.BDY]
+    reals[:, pp_template.BDX] = 360.0 / nlon
+    reals[:, pp_template.BZX] = -0.5 * reals[0, pp_template.BDX]
+    lats, lons = pp_template.grid_points(ints[0], reals[0])
+    return pp_template.Template(None, ints, reals, lats, lons)
+
+
+def synthetic_land(lats, lons):
+    """Made-up land fraction: smooth continents with fractional coasts."""
+    lat = np.radians(lats)[:, np.newaxis]
+    lon = np.radians(lons)[np.newaxis, :]
+    height = np.sin(3 * lon) * np.cos(2 * lat) + 0.5 * np.sin(5 * lat + lon)
+    return np.clip(4.0 * height, 0.0, 1.0)
+
+
+def random_boxes(nregions, seed=0):
+    """nregions random [W, S, E, N] boxes, some across the Greenwich meridian."""
+    rng = np.random.default_rng(seed)
+    west = rng.uniform(0, 360, nregions)
+    south = rng.uniform(-70, 60, nregions)
+    width = rng.uniform(10, 80, nregions)
+    height = rng.uniform(5, 30, nregions)
+    return np.column_stack([west, south, (west + width) % 360, south + height])
+
+
+@contextlib.contextmanager
+def stage(name, results):
+    """Time a block and record (seconds, peak traced bytes) under results[name]."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[name] = (elapsed, peak)
+
+
+def run_case(n, nregions, workdir, overlap='first', ocean_threshold=None, infile=mcb_ancil.INFILE):
+    """Run every stage once for grid N<n> and nregions; returns {stage: (s, bytes)}."""
+    results = {}
+    template = synthetic_template(n, infile)
+    tfile = os.path.join(workdir, 'template_n{}.pp'.format(n))
+    if not os.path.exists(tfile):
+        pp_template.save_pp(template, np.zeros(grid_shape(n), dtype='f4'), tfile, stash=24)
+    land = synthetic_land(template.lats, template.lons)
+    boxes = random_boxes(nregions)
+
+    with stage('load', results):
+        template = pp_template.load_template(tfile)
+    with stage('areas', results):
+        grid_areas = pp_template.area_weights(template.lats, template.lons)
+    with stage('masks', results):
+        weights = region_mask.ocean_weights(land, ocean_threshold)
+        ocean = weights > 0
+        points = [region_mask.box_points(template.lats, template.lons, box, ocean) for box in boxes]
+    with stage('index', results):
+        index = region_index.index_points(ocean.shape, points, overlap)
+        region_index.region_areas(index, grid_areas * weights)
+        region_index.union_area(index, grid_areas * weights)
+    targets = np.full(nregions, 50.0 / nregions)
+    with stage('fill', results):
+        solver = rate_solver.make_solver(index, grid_areas, weights)
+        targets = np.where(solver.areas > 0, targets, 0.0)
+        field = rate_solver.solve(solver, targets)
+        data = np.empty((len(template.ints),) + field.shape, dtype='f4')
+        region_mask.fill_time_series(data, field)
+    with stage('total', results):
+        total = rate_solver.total_tgyr(data[0].astype('f8'), grid_areas)
+    rate_solver.check_total(total, targets)
+    with stage('save', results):
+        pp_template.save_pp(template, data, os.path.join(workdir, 'out.pp'))
+
+    if iris is not None:
+        with stage('iris_load', results):
+            cube = iris.load_cube(tfile)
+        with stage('iris_save', results):
+            iris.save(cube.copy(data=data), os.path.join(workdir, 'out_iris.pp'))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time the ancillary-generation stages on synthetic grids.')
+    parser.add_argument('--grids', type=int, nargs='+', default=GRIDS, help='UM resolutions N to run')
+    parser.add_argument('--regions', type=int, nargs='+', default=REGIONS, help='numbers of regions to run')
+    parser.add_argument('--repeat', type=int, default=1, help='runs per case (best time is kept)')
+    parser.add_argument('--overlap', default='first', choices=region_index.OVERLAP_POLICIES,
+                        help='how points in more than one region are counted')
+    parser.add_argument('--ocean-threshold', type=float,
+                        help='weight by ocean fraction, keeping points with more ocean than this')
+    parser.add_argument('--infile', default=mcb_ancil.INFILE, help='template pp-file (for its headers)')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='mcb_bench_')
+    try:
+        print('{:>6} {:>8} {:>10} {:>10} {:>10}'.format('grid', 'regions', 'stage', 'time (s)', 'peak (MB)'))
+        for n in args.grids:
+            for nregions in args.regions:
+                results = {}
+                for _ in range(args.repeat):
+                    for name, (elapsed, peak) in run_case(n, nregions, workdir, args.overlap,
+                                                          args.ocean_threshold, args.infile).items():
+                        best = results.get(name, (np.inf, 0))
+                        results[name] = (min(best[0], elapsed), max(best[1], peak))
+                for name, (elapsed, peak) in results.items():
+                    print('{:>6} {:>8} {:>10} {:>10.4f} {:>10.1f}'
+                          .format('N{}'.format(n), nregions, name, elapsed, peak / 2**20))
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
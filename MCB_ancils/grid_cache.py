@@ -0,0 +1,98 @@
+# On-disk cache of the grid products the ancillary scripts recompute on
+# every run: gridbox areas, the ocean weights and the ocean points of each
+# region.
+#
+# Arrays are stored as .npy files under
+#
+#    <cachedir>/<key>/<name>.npy
+#
+# where <key> is a hash of the grid coordinates (points and any bounds)
+# and the contents of the land-fraction file, so a different grid or an
+# edited land fraction gets a fresh directory and stale entries are never
+# read. Cached arrays are loaded memory-mapped, so a cache hit costs
+# almost nothing. Delete the cache directory to clear it.
+
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+
+# Bump this if the way cached arrays are computed changes:
+CACHE_VERSION = 1
+
+
+def hash_file(path, blocksize=1 << 20):
+    """SHA-1 (hex) of a file's contents, read a block at a time."""
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def grid_key(coords, landfile=None):
+    """Hash of the grid coordinates and land-fraction file contents.
+
+    coords are iris coords or plain arrays of points. Without a landfile
+    the key depends on the coordinates alone (e.g. regridding weights).
+    """
+    h = hashlib.sha1(str(CACHE_VERSION).encode())
+    for coord in coords:
+        h.update(np.ascontiguousarray(getattr(coord, 'points', coord), dtype='f8').tobytes())
+        if getattr(coord, 'has_bounds', lambda: False)():
+            h.update(np.ascontiguousarray(coord.bounds, dtype='f8').tobytes())
+    if landfile is not None:
+        h.update(hash_file(os.path.expanduser(landfile)).encode())
+    return h.hexdigest()[:16]
+
+
+def cache_path(cachedir, coords, landfile=None):
+    """Directory holding the cached arrays for this grid and land fraction."""
+    path = os.path.join(os.path.expanduser(cachedir), grid_key(coords, landfile))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def save_array(path, name, array):
+    """Write <path>/<name>.npy, replacing any old one.
+
+    The file is written to a temporary name and renamed, so an
+    interrupted run can't leave a truncated entry behind.
+    """
+    fname = os.path.join(path, name + '.npy')
+    fd, tmp = tempfile.mkstemp(dir=path, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, np.asarray(array))
+        os.replace(tmp, fname)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return fname
+
+
+def cached_array(path, name, compute):
+    """Load <path>/<name>.npy memory-mapped, computing and saving it if missing."""
+    fname = os.path.join(path, name + '.npy')
+    if not os.path.exists(fname):
+        save_array(path, name, compute())
+    return np.load(fname, mmap_mode='r')
+
+
+def box_name(box):
+    """Cache entry name for the ocean points of region box [W, S, E, N].
+
+    Each edge is written out in full (the shortest form that reads back
+    as the same float), so boxes differing in any digit get different
+    entries.
+    """
+    return 'region_' + '_'.join(np.format_float_positional(float(b), trim='-') for b in box)
+
+
+def ocean_name(threshold=None):
+    """Cache entry name for the ocean weights (see region_mask.ocean_weights)."""
+    if threshold is None:
+        return 'ocean_weights'
+    return 'ocean_fraction_{:g}'.format(threshold)
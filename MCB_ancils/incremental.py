@@ -0,0 +1,119 @@
+# Incremental regeneration: when only the emission amounts change, reuse
+# everything else from the last run.
+#
+# => python3 mcb_ancil.py mixed.pp --regions 1 2 3 --tgyr 10 20 5 --cachedir ~/mcb_cache --incremental
+# => python3 mcb_ancil.py mixed.pp --regions 1 2 3 --tgyr 10 25 5 --cachedir ~/mcb_cache --incremental
+#
+# The solver for a set of regions (its points, weights and areas; see
+# rate_solver.py) is kept in the grid cache (see grid_cache.py) under a
+# hash of the grid, regions and overlap policy, along with the last
+# field made with it and that field's per-region coefficients (together
+# in one state.npz, written to a temporary name and renamed, so the
+# two always belong together even if a run is interrupted). A rerun
+# with the same regions loads these memory-mapped instead of building
+# masks and the region index, compares the new coefficients with the
+# stored ones, and recomputes only the points of regions whose amounts
+# changed. The field is then saved as usual.
+
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+import grid_cache
+import mcb_ancil
+import rate_solver
+import region_config
+
+
+def solver_path(grid, regions, overlap='first'):
+    """Cache directory for the solver of a set of regions on a grid."""
+    if grid.cache is None:
+        raise ValueError('incremental regeneration needs a cache directory')
+    h = hashlib.sha1(os.path.basename(grid.cache).encode())
+    for region in mcb_ancil.resolve_regions(regions):
+        h.update(region_config.cache_name(region).encode() + b'|')
+    h.update(overlap.encode())
+    path = os.path.join(grid.cache, 'solver_' + h.hexdigest()[:16])
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def cached_solver(grid, regions, overlap='first'):
+    """Solver for the regions, built once and then loaded from the cache.
+
+    Returns the solver and its cache directory.
+    """
+    path = solver_path(grid, regions, overlap)
+    made = []
+
+    def compute(name):
+        # Build the solver at most once, whichever entries are missing:
+        if not made:
+            made.append(mcb_ancil.build_regions(grid, regions, overlap))
+        return getattr(made[0], name)
+
+    arrays = [grid_cache.cached_array(path, name, lambda: compute(name))
+              for name in ('support', 'indptr', 'regions', 'weights', 'areas')]
+    return rate_solver.Solver(grid.ocean.shape, *arrays), path
+
+
+STATE = 'state.npz'
+
+
+def load_state(path):
+    """(field, coefficients) last saved in path, or None if there are none."""
+    try:
+        with np.load(os.path.join(path, STATE)) as f:
+            return f['field'], f['coefficients']
+    except FileNotFoundError:
+        return None
+
+
+def save_state(path, field, coefficients):
+    """Save a field and its coefficients together, replacing the old ones."""
+    fd, tmp = tempfile.mkstemp(dir=path, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, field=field, coefficients=coefficients)
+        os.replace(tmp, os.path.join(path, STATE))
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def update_field(solver, targets, path):
+    """Field for targets (Tg/yr), updated from the last one saved in path.
+
+    Returns the field and the indices of the regions whose coefficients
+    changed (all of them if there was no previous field).
+    """
+    coefficients = rate_solver.region_coefficients(solver, targets)
+    state = load_state(path)
+    if state is not None:
+        field, old = state
+        changed = np.flatnonzero(coefficients != old)
+        # Only the points of changed regions (each over all its regions):
+        counts = np.diff(solver.indptr)
+        entry_rows = np.repeat(np.arange(len(solver.support)), counts)
+        rows = np.unique(entry_rows[np.isin(solver.regions, changed)])
+        entries = np.isin(entry_rows, rows)
+        if len(rows):
+            contrib = solver.weights[entries] * coefficients[solver.regions[entries]]
+            starts = np.concatenate([[0], np.cumsum(counts[rows])[:-1]])
+            field.reshape(-1)[solver.support[rows]] = np.add.reduceat(contrib, starts)
+    else:
+        field = rate_solver.solve(solver, targets)
+        changed = np.arange(len(coefficients))
+    if len(changed):
+        save_state(path, field, coefficients)
+    return field, changed
+
+
+def regenerate(grid, regions, tgyr, overlap='first'):
+    """Field, targets and changed regions for amounts tgyr (see mcb_ancil.region_targets)."""
+    solver, path = cached_solver(grid, regions, overlap)
+    targets = mcb_ancil.region_targets(solver, tgyr)
+    field, changed = update_field(solver, targets, path)
+    return field, targets, changed
@@ -0,0 +1,113 @@
+# Stage timings and memory use for the generation scripts.
+#
+# A run is split into named stages, either with "with stage(name):" or,
+# in the flat scripts, with mark(name), which ends the stage before it:
+#
+#    instrument.begin('bdd_ancil.py', trace=True, rsel=rsel)
+#    instrument.mark('load')
+#    ...
+#    instrument.mark('save')
+#    ...
+#    instrument.report('timings.json')
+#
+# Each stage records its wall time, the process's peak RSS so far and,
+# with trace=True, the peak memory allocated during the stage (through
+# tracemalloc, which sees numpy arrays but slows allocation a little).
+# report() prints a table and optionally writes the run summary as JSON,
+# one file per run, for adding up over many batch runs.
+#
+# There is one run per process, kept in module globals.
+
+import contextlib
+import json
+import os
+import resource
+import socket
+import sys
+import time
+import tracemalloc
+
+
+_run = None
+_current = None
+
+
+def _rss_mb():
+    # ru_maxrss is in KB on Linux, bytes on macOS:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2**20 if sys.platform == 'darwin' else rss / 2**10
+
+
+def begin(name, trace=False, **info):
+    """Start timing a run; info (settings etc.) goes into the summary."""
+    global _run, _current
+    _run = {'run': name, 'host': socket.gethostname(), 'pid': os.getpid(),
+            'started': time.time(), 'info': info, 'stages': []}
+    _current = None
+    _run['t0'] = time.perf_counter()
+    if trace and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def end():
+    """End the current stage, if any."""
+    global _current
+    if _current is None:
+        return
+    record = _current
+    _current = None
+    record['seconds'] = time.perf_counter() - record.pop('t0')
+    record['max_rss_mb'] = _rss_mb()
+    if tracemalloc.is_tracing():
+        record['traced_peak_mb'] = tracemalloc.get_traced_memory()[1] / 2**20
+    _run['stages'].append(record)
+
+
+def mark(name):
+    """End the current stage and start a new one."""
+    global _current
+    if _run is None:
+        begin(os.path.basename(sys.argv[0]))
+    end()
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+    _current = {'stage': name, 't0': time.perf_counter()}
+
+
+@contextlib.contextmanager
+def stage(name):
+    """Time the block as stage name."""
+    mark(name)
+    try:
+        yield
+    finally:
+        end()
+
+
+def summary():
+    """The run so far as a JSON-able dict."""
+    if _run is None:
+        return None
+    run = {k: v for k, v in _run.items() if k != 't0'}
+    run['seconds'] = time.perf_counter() - _run['t0']
+    run['max_rss_mb'] = _rss_mb()
+    return run
+
+
+def report(jsonfile=None, quiet=False):
+    """End the run's last stage, print the stage table and write jsonfile."""
+    end()
+    run = summary()
+    if run is None:
+        return None
+    if not quiet:
+        print('\n{:<16} {:>10} {:>12} {:>12}'.format('stage', 'time (s)', 'RSS (MB)', 'peak (MB)'))
+        for record in run['stages']:
+            print('{:<16} {:>10.3f} {:>12.1f} {:>12}'.format(
+                record['stage'], record['seconds'], record['max_rss_mb'],
+                '{:.1f}'.format(record['traced_peak_mb']) if 'traced_peak_mb' in record else '-'))
+        print('{:<16} {:>10.3f} {:>12.1f}'.format('(whole run)', run['seconds'], run['max_rss_mb']))
+    if jsonfile is not None:
+        with open(os.path.expanduser(jsonfile), 'w') as f:
+            json.dump(run, f, indent=1, default=str)
+    return run
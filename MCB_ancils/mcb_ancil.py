@@ -0,0 +1,345 @@
+# Library interface to the MCB emission ancillaries, for calling from
+# other Python code (e.g. an optimisation loop) rather than editing and
+# rerunning bdd_ancil.py/create_ancil.py.
+#
+#    import mcb_ancil
+#    grid = mcb_ancil.load_grid()                   # once
+#    solver = mcb_ancil.build_regions(grid, [1, 2, 3])
+#    field = mcb_ancil.compute_field(solver, [10, 20, 5])
+#    mcb_ancil.write_ancil(grid, field, 'mixed.pp')
+#
+# The grid (template headers, gridbox areas, ocean weights) and each set
+# of regions are set up once and can then be reused for any number of
+# emission amounts, each costing one small solve (see rate_solver.py).
+# Nothing here needs iris, which is only imported to write .anc files.
+#
+# As a command-line tool it does what bdd_ancil.py does:
+#
+# => python3 mcb_ancil.py NO_50Tg_MCB.pp --regions 16 --tgyr 50
+# => python3 mcb_ancil.py mixed.anc --regions 1 2 3 --tgyr 10 20 5
+# => python3 mcb_ancil.py decks.pp --config decks.geojson --tgyr 50
+# => python3 mcb_ancil.py modes.anc --regions 16 --tgyr 50 --fields modes.json
+#
+# Regions are region numbers from regions.py, [W, S, E, N] boxes, or
+# boxes and polygons read from a config or GeoJSON file (see
+# region_config.py). With --fields, several fields derived from the one
+# mass flux (e.g. accumulation and coarse mode mass and number fluxes,
+# each with its own STASH code, units and scaling; see load_fields) are
+# written to the one output file, sharing the grid and regions.
+#
+# For smaller files to copy to the HPC, --wgdos packs a .pp opfile (see
+# wgdos.py; about 7 times smaller, with every value within 2**(acc - 1),
+# ~1e-7 of the field's largest value at the default 24 bits, so not
+# exact where values differ, e.g. several regions at different rates or
+# ocean-fraction weights), and a .nc opfile is written as zlib-compressed
+# netCDF in monthly chunks (needs iris, see ancil_writer.netcdf_options).
+
+import argparse
+import collections
+
+import numpy as np
+
+import grid_cache
+import instrument
+import pp_template
+import rate_solver
+import region_config
+import region_index
+import region_mask
+from regions import rs
+
+
+INFILE = 'cp109a.pm_2040_jan_to_dec_00024.pp'
+LANDFILE = 'aw310a.land_fraction.pp'
+
+Grid = collections.namedtuple('Grid', ['template', 'lats', 'lons', 'grid_areas', 'ocean',
+                                         'ocean_weights', 'cache'])
+
+# An output field derived from the sea-salt mass flux: its STASH item
+# (section 0), name, units and the factor it's the mass flux times (e.g.
+# a mode's mass fraction, or number per kg for a number flux).
+FieldSpec = collections.namedtuple('FieldSpec', ['stash', 'name', 'units', 'scale'])
+
+SEA_SALT = FieldSpec(301, 'Sea-salt emissions', 'kg m-2 s-1', 1.0)
+
+
+def load_grid(infile=INFILE, landfile=LANDFILE, cachedir=None, ocean_threshold=None):
+    """Read the template headers, gridbox areas and ocean weights once.
+
+    See load_land for the land fraction. With a cachedir, the areas,
+    ocean weights and region points are kept on disk between runs (see
+    grid_cache.py). See region_mask.ocean_weights for ocean_threshold.
+    """
+    template = pp_template.load_template(infile)
+    lats, lons = template.lats, template.lons
+
+    def get_ocean():
+        return region_mask.ocean_weights(load_land(landfile), ocean_threshold)
+
+    if cachedir is None:
+        cache = None
+        grid_areas = pp_template.area_weights(lats, lons)
+        ocean_weights = get_ocean()
+    else:
+        # The region points depend on the threshold, so each gets its own entries:
+        coords = [lats, lons] if ocean_threshold is None else [lats, lons, [ocean_threshold]]
+        cache = grid_cache.cache_path(cachedir, coords, landfile)
+        grid_areas = grid_cache.cached_array(cache, 'grid_areas',
+                                             lambda: pp_template.area_weights(lats, lons))
+        ocean_weights = grid_cache.cached_array(cache, grid_cache.ocean_name(ocean_threshold), get_ocean)
+    return Grid(template, lats, lons, grid_areas, ocean_weights > 0, ocean_weights, cache)
+
+
+def load_land(landfile=LANDFILE):
+    """Land fraction as a (lat, lon) array.
+
+    An unpacked pp-file is read as a zero-copy view of the file (see
+    pp_template.data_views); anything else is loaded with iris.
+    """
+    try:
+        return pp_template.load_field(landfile)
+    except ValueError:
+        import iris
+        return iris.load_cube(landfile).data
+
+
+def region_points(grid, regions):
+    """Flat (lat * nlon + lon) indices of the ocean points in each region.
+
+    regions are [W, S, E, N] boxes or region_config.Regions. Boxes are
+    indexed from their lat/lon ranges (see region_mask.box_points), so
+    no whole-grid mask is made for them.
+    """
+    def points(region):
+        box = region.box if isinstance(region, region_config.Region) else region
+        if box is not None:
+            return region_mask.box_points(grid.lats, grid.lons, box, grid.ocean)
+        return np.flatnonzero(region_config.region_mask_of(grid.lats, grid.lons, region) & grid.ocean)
+
+    if grid.cache is None:
+        return [points(r) for r in regions]
+    return [grid_cache.cached_array(grid.cache, region_config.cache_name(r), lambda: points(r))
+            for r in regions]
+
+
+def resolve_regions(regions):
+    """Boxes or Regions from region numbers (regions.py), boxes and Regions.
+
+    Raises ValueError for a region number that isn't in regions.py.
+    """
+    resolved = []
+    for r in regions:
+        if isinstance(r, region_config.Region):
+            resolved.append(r)
+        elif np.ndim(r) == 0:
+            if not 1 <= r <= len(rs):
+                raise ValueError('no region R{} (regions.py has R1-R{})'.format(r, len(rs)))
+            resolved.append(rs[r - 1])
+        else:
+            resolved.append(list(r))
+    return resolved
+
+
+def build_regions(grid, regions, overlap='first'):
+    """Rate solver (see rate_solver.py) for a list of regions.
+
+    regions are region numbers from regions.py, [W, S, E, N] boxes or
+    Regions read by region_config.load_regions.
+    """
+    index = region_index.index_points(grid.ocean.shape, region_points(grid, resolve_regions(regions)), overlap)
+    return rate_solver.make_solver(index, grid.grid_areas, grid.ocean_weights)
+
+
+def region_targets(solver, tgyr):
+    """Per-region targets (Tg/yr) from one total or one amount per region."""
+    tgyr = np.atleast_1d(np.asarray(tgyr, dtype='f8'))
+    if len(tgyr) == 1:
+        # Equal flux everywhere, as in bdd_ancil.py:
+        return tgyr[0] * solver.areas / np.sum(solver.areas)
+    if len(tgyr) != len(solver.areas):
+        raise ValueError('need one total or one amount per region, got {} amounts for {} regions'
+                         .format(len(tgyr), len(solver.areas)))
+    return tgyr
+
+
+def compute_field(solver, tgyr):
+    """2-D emission field (kg m-2 s-1) for a total or per-region amounts (Tg/yr).
+
+    tgyr may also be a (nvectors, nregions) array, giving a stack of fields.
+    """
+    if np.ndim(tgyr) == 2:
+        return rate_solver.solve(solver, tgyr)
+    return rate_solver.solve(solver, region_targets(solver, tgyr))
+
+
+def total_tgyr(grid, field):
+    """Global total (Tg/yr) of an emission field."""
+    return rate_solver.total_tgyr(field, grid.grid_areas)
+
+
+def template_cube(infile=INFILE, stash=301, name=SEA_SALT.name, units=SEA_SALT.units):
+    """Template cube set up for the emissions (needs iris)."""
+    import iris
+    template = iris.load_cube(infile, iris.AttributeConstraint(STASH='m01s00i024'))
+    return _label(template, FieldSpec(stash, name, units, 1.0))
+
+
+def _label(cube, spec):
+    # Set a cube's STASH code, name and units from a FieldSpec.
+    import cf_units
+    import iris
+    cube.attributes['STASH'] = iris.fileformats.pp.STASH(1, 00, spec.stash)
+    cube.rename(spec.name)
+    cube.units = cf_units.Unit(spec.units)
+    return cube
+
+
+def write_ancil(grid, field, opfile, stash=301, wgdos_bits=None):
+    """Save a field (used for every month) or one field per month.
+
+    A .anc opfile is written as a UM ancillary plus .anc.nc (needs iris
+    and mule, see ancil_writer.py), a .nc opfile as compressed netCDF
+    (needs iris) and anything else as a pp-file, WGDOS-packed if
+    wgdos_bits is given (see pp_template.save_pp).
+    """
+    write_fields(grid, field, opfile, [SEA_SALT._replace(stash=stash)], wgdos_bits)
+
+
+def load_fields(path):
+    """List of FieldSpecs from a JSON/YAML file:
+
+       {"fields": [
+         {"stash": 301, "name": "Sea-salt emissions", "units": "kg m-2 s-1"},
+         {"stash": 302, "name": "Sea-salt number emissions", "units": "m-2 s-1", "scale": 1.2e16}
+       ]}
+
+    scale defaults to 1.
+    """
+    specs = []
+    for entry in region_config.read_config(path)['fields']:
+        if 'stash' not in entry or 'name' not in entry:
+            raise ValueError('{}: every field needs a stash and name, got {}'.format(path, entry))
+        specs.append(FieldSpec(int(entry['stash']), entry['name'], entry.get('units', SEA_SALT.units),
+                               float(entry.get('scale', 1.0))))
+    stashes = [spec.stash for spec in specs]
+    if len(set(stashes)) != len(stashes):
+        raise ValueError('{}: STASH codes repeated in {}'.format(path, stashes))
+    return specs
+
+
+def write_fields(grid, field, opfile, specs, wgdos_bits=None):
+    """Save several fields derived from one mass flux field to one file.
+
+    field is as for write_ancil and specs a list of FieldSpecs; each
+    output field is field times its scale. The fields share the grid and
+    times, and are written all together for each month in turn.
+    """
+    data = [field if spec.scale == 1 else field * spec.scale for spec in specs]
+    if not opfile.endswith(('.anc', '.nc')):
+        pp_template.save_pp_fields(grid.template, [(spec.stash, d) for spec, d in zip(specs, data)],
+                                   opfile, wgdos_bits)
+        return
+    if wgdos_bits is not None:
+        raise ValueError('WGDOS packing is only for pp-files, not {}'.format(opfile))
+    import ancil_writer
+    # The template is loaded once and copied for each field:
+    template = template_cube(grid.template.path)
+    cubes = []
+    for spec, d in zip(specs, data):
+        if np.ndim(d) == 2:
+            d = region_mask.lazy_time_series(d, template.shape, template.dtype)
+        else:
+            d = np.asarray(d, dtype=template.dtype)
+        cubes.append(_label(template.copy(data=d), spec))
+    if opfile.endswith('.nc'):
+        ancil_writer.save_netcdf(cubes, opfile)
+    else:
+        ancil_writer.save_ancil_fields(cubes, opfile, [spec.stash for spec in specs])
+
+
+def select_regions(selection, config=None):
+    """Regions picked by number or name (strings, as on the command line).
+
+    Without a config file these are region numbers from regions.py; with
+    one, 1-based positions or names in it, or all of it if selection is
+    empty.
+    """
+    if config is None:
+        if not selection:
+            raise ValueError('no regions selected')
+        return [int(r) for r in selection]
+    available = region_config.load_regions(config)
+    if not selection:
+        return available
+    names = {region.name: region for region in available}
+    chosen = []
+    for r in selection:
+        if r in names:
+            chosen.append(names[r])
+        elif r.isdigit() and 1 <= int(r) <= len(available):
+            chosen.append(available[int(r) - 1])
+        else:
+            raise ValueError('no region {!r} in {}'.format(r, config))
+    return chosen
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build an MCB emission ancillary.')
+    parser.add_argument('opfile', help='output file (.pp, .nc, or .anc for a UM ancillary)')
+    parser.add_argument('--regions', nargs='+',
+                        help='region numbers (regions.py), or numbers or names in --config')
+    parser.add_argument('--config', help='JSON/YAML/GeoJSON region file (default all its regions)')
+    parser.add_argument('--tgyr', type=float, nargs='+', required=True,
+                        help='total Tg/yr (equal flux) or one amount per region')
+    parser.add_argument('--infile', default=INFILE, help='template pp-file')
+    parser.add_argument('--landfile', default=LANDFILE, help='land-fraction pp-file')
+    parser.add_argument('--cachedir', help='cache grid areas and masks here between runs')
+    parser.add_argument('--overlap', default='first', choices=region_index.OVERLAP_POLICIES,
+                        help='how points in more than one region are counted')
+    parser.add_argument('--ocean-threshold', type=float,
+                        help='weight by ocean fraction, keeping points with more ocean than this')
+    parser.add_argument('--timings', metavar='JSON',
+                        help='print stage timings and memory use, and save them as JSON here')
+    parser.add_argument('--incremental', action='store_true',
+                        help='reuse the regions and last field from the cache (see incremental.py)')
+    parser.add_argument('--fields', metavar='FILE',
+                        help='JSON/YAML list of fields to write (see load_fields; default sea-salt mass)')
+    parser.add_argument('--wgdos', type=int, metavar='BITS', nargs='?', const=24,
+                        help='WGDOS-pack a .pp opfile, keeping BITS bits of precision (default 24)')
+    args = parser.parse_args(argv)
+    if args.incremental and args.cachedir is None:
+        parser.error('--incremental needs --cachedir')
+    if args.wgdos is not None and args.opfile.endswith(('.anc', '.nc')):
+        parser.error('--wgdos is only for .pp output')
+
+    instrument.begin('mcb_ancil.py', trace=args.timings is not None, **vars(args))
+    with instrument.stage('load_grid'):
+        grid = load_grid(args.infile, args.landfile, args.cachedir, args.ocean_threshold)
+    regions = select_regions(args.regions, args.config)
+    specs = [SEA_SALT] if args.fields is None else load_fields(args.fields)
+    if args.incremental:
+        # (imported here as it builds on this module)
+        import incremental
+        with instrument.stage('update'):
+            field, targets, changed = incremental.regenerate(grid, regions, args.tgyr, args.overlap)
+        print('regions recomputed: {}'.format(', '.join(str(k + 1) for k in changed) or 'none'))
+    else:
+        with instrument.stage('regions'):
+            solver = build_regions(grid, regions, args.overlap)
+        with instrument.stage('fill'):
+            targets = region_targets(solver, args.tgyr)
+            field = compute_field(solver, targets)
+    total = total_tgyr(grid, field)
+    rate_solver.check_total(total, targets)
+    with instrument.stage('save'):
+        write_fields(grid, field, args.opfile, specs, args.wgdos)
+    if args.fields is not None:
+        print('{}: STASH {}'.format(args.opfile, ', '.join(str(spec.stash) for spec in specs)))
+    print('{}: area (million km2) = {:.4f}, total (Tg[sea-salt]/yr) = {:.4f}'
+          .format(args.opfile, np.sum(grid.grid_areas, where=field != 0) * 1e-12, total))
+    if args.timings is not None:
+        instrument.report(args.timings)
+
+
+if __name__ == '__main__':
+    main()
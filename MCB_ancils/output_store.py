@@ -0,0 +1,201 @@
+# Resumable output for scenario sweeps: outputs that are already there
+# from the same scenario definition aren't built again, and outputs are
+# written atomically, so a sweep stopped by a job time limit (or a
+# crash) can simply be rerun to finish it.
+#
+# => python3 batch_ancil.py scenarios.csv --outdir sweep --resume
+# => python3 parallel_ancil.py scenarios.csv --outdir sweep --resume
+#
+# Each output is keyed on a hash of its full definition: the scenario
+# (regions, rates, schedule), the run settings (overlap policy, ocean
+# threshold, packing, ...), the contents of the template and
+# land-fraction files, and the code version (a hash of the LIBRARY
+# modules the outputs are built from, regions.py included, but not of
+# scripts like bdd_ancil.py whose settings users edit, since those
+# settings are in the definition already). The key is recorded with the
+# output's size and summary (total, area) in <outdir>/manifest.json, so
+#
+#    {"NO_50Tg_MCB.pp": {"key": "3f1c...", "definition": {...},
+#                        "bytes": {"NO_50Tg_MCB.pp": 1330368},
+#                        "info": {"total": 50.0, "area": 1.95e13},
+#                        "written": "2040-01-01T00:00:00"}, ...}
+#
+# and an output is skipped when its manifest entry has the same key and
+# its files are all there with the recorded sizes. Anything else (new
+# or edited scenarios, changed settings, input files or code, or outputs
+# deleted or truncated by hand) is built again.
+#
+# Outputs are written to a temporary name in the same directory and
+# renamed into place once complete (as grid_cache.py does for its
+# arrays), so the output name never holds a partly-written file, and
+# the manifest is then updated the same way. The manifest is locked
+# (with a manifest.json.lock file, left in place) while it's updated,
+# so parallel workers can share it.
+
+import collections
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import time
+
+import grid_cache
+
+
+MANIFEST = 'manifest.json'
+
+# Bump this if the way keys are made changes:
+STORE_VERSION = 2
+
+# Modules whose code goes into the outputs, hashed for the code version:
+LIBRARY = ['ancil_writer', 'basis', 'batch_ancil', 'grid_cache', 'incremental',
+           'mcb_ancil', 'pp_template', 'rate_solver', 'region_config', 'region_index',
+           'region_mask', 'regions', 'regrid', 'schedule', 'ship_tracks', 'wgdos']
+
+# What every output of a sweep shares: the run settings (a JSON-able
+# dict) and input files (the template and land fraction).
+Sweep = collections.namedtuple('Sweep', ['settings', 'files'])
+
+_file_hashes = {}
+_code_version = []
+
+
+def _plain(value):
+    # JSON form of numpy values and tuples in a definition.
+    return value.tolist() if hasattr(value, 'tolist') else list(value)
+
+
+def code_version():
+    """Hash of the LIBRARY modules (worked out once per run)."""
+    if not _code_version:
+        h = hashlib.sha1()
+        for name in LIBRARY:
+            path = os.path.join(os.path.dirname(os.path.abspath(__file__)), name + '.py')
+            h.update(name.encode() + b'|')
+            with open(path, 'rb') as f:
+                h.update(f.read())
+        _code_version.append(h.hexdigest()[:16])
+    return _code_version[0]
+
+
+def file_hash(path):
+    """Hash of a file's contents, remembered while its size and mtime stay the same."""
+    path = os.path.abspath(os.path.expanduser(path))
+    stat = os.stat(path)
+    ident = (path, stat.st_size, stat.st_mtime_ns)
+    if ident not in _file_hashes:
+        _file_hashes[ident] = grid_cache.hash_file(path)
+    return _file_hashes[ident]
+
+
+def scenario_key(definition, files=()):
+    """Key for an output: definition is a JSON-able dict of everything
+    that sets it, files the input files it's made from (by contents).
+    """
+    h = hashlib.sha1(str(STORE_VERSION).encode())
+    h.update(json.dumps(definition, sort_keys=True, default=_plain).encode())
+    for path in files:
+        h.update(file_hash(path).encode())
+    h.update(code_version().encode())
+    return h.hexdigest()
+
+
+def make_sweep(infile, landfile, **settings):
+    """Sweep for outputs made from infile and landfile with these settings."""
+    return Sweep(settings, [infile, landfile])
+
+
+def output_paths(opfile):
+    """Files written for an output: a .anc output also has its .anc.nc."""
+    return [opfile, opfile + '.nc'] if opfile.endswith('.anc') else [opfile]
+
+
+def read_manifest(outdir):
+    """The manifest of an output directory ({} if there isn't one)."""
+    try:
+        with open(os.path.join(outdir, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def is_done(outdir, name, key):
+    """Whether output name (relative to outdir) was written with this key.
+
+    Returns its manifest entry if so, otherwise None.
+    """
+    entry = read_manifest(outdir).get(name)
+    if entry is None or entry['key'] != key:
+        return None
+    for fname, size in entry['bytes'].items():
+        path = os.path.join(outdir, os.path.dirname(name), fname)
+        if not os.path.exists(path) or os.path.getsize(path) != size:
+            return None
+    return entry
+
+
+@contextlib.contextmanager
+def atomic_output(opfile):
+    """Context manager giving a temporary path to write opfile to.
+
+    The temporary files (with the same suffix as opfile, so the writers
+    pick the same format) are renamed to opfile, and to its .anc.nc for
+    a .anc, when the block completes, or removed if it fails.
+    """
+    directory, base = os.path.split(os.path.abspath(os.path.expanduser(opfile)))
+    os.makedirs(directory, exist_ok=True)
+    # (named by the process, so parallel workers never share one):
+    tmp = os.path.join(directory, '.tmp.{}.{}'.format(os.getpid(), base))
+    try:
+        yield tmp
+        for tmp_path, path in zip(output_paths(tmp), output_paths(opfile)):
+            if os.path.exists(tmp_path):
+                os.replace(tmp_path, path)
+    except BaseException:
+        for tmp_path in output_paths(tmp):
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+        raise
+
+
+def record(outdir, name, key, definition, info=None):
+    """Add (or replace) the manifest entry of output name.
+
+    Raises FileNotFoundError if any of its files (see output_paths) is
+    missing, e.g. if the writer didn't write anything.
+    """
+    opfile = os.path.join(outdir, name)
+    missing = [p for p in output_paths(opfile) if not os.path.exists(p)]
+    if missing:
+        raise FileNotFoundError('{} not written, so not recorded in {}'.format(', '.join(missing), MANIFEST))
+    entry = {'key': key, 'definition': definition,
+             'bytes': {os.path.basename(p): os.path.getsize(p) for p in output_paths(opfile)},
+             'info': info or {}, 'written': time.strftime('%Y-%m-%dT%H:%M:%S')}
+    with open(os.path.join(outdir, MANIFEST + '.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        manifest = read_manifest(outdir)
+        manifest[name] = entry
+        tmp = os.path.join(outdir, '.tmp.{}.{}'.format(os.getpid(), MANIFEST))
+        with open(tmp, 'w') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True, default=_plain)
+        os.replace(tmp, os.path.join(outdir, MANIFEST))
+
+
+def build(outdir, name, definition, files, write, skip=True):
+    """Build output name (relative to outdir), atomically, and record it.
+
+    write(path) writes the output to path and returns a JSON-able dict
+    summarising it, which is kept in the manifest. With skip, an output
+    that's already done (see is_done) isn't built again. Returns (info,
+    written): that summary (from the manifest if the output was
+    skipped) and whether the output was written this time.
+    """
+    key = scenario_key(definition, files)
+    entry = is_done(outdir, name, key) if skip else None
+    if entry is not None:
+        return entry['info'], False
+    with atomic_output(os.path.join(outdir, name)) as tmp:
+        info = write(tmp)
+    record(outdir, name, key, definition, info)
+    return info, True
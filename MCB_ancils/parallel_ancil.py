@@ -0,0 +1,87 @@
+# Parallel version of batch_ancil.py: fans the scenarios of a table out
+# over a pool of worker processes, each building and saving its own
+# output files.
+#
+# => python3 parallel_ancil.py scenarios.csv --processes 32
+#
+# The template cube, gridbox areas and ocean weights are loaded once in the
+# parent process before the pool is started. Workers are forked, so they
+# inherit the grid read-only (copy-on-write) rather than having it
+# pickled and sent with each task; only the small Scenario tuples and
+# the printed summaries go between processes.
+#
+# Forking is only available on Linux/macOS, which is where we run this.
+
+import argparse
+import multiprocessing
+import os
+
+import batch_ancil
+import instrument
+import mcb_ancil
+import output_store
+import region_index
+
+
+# Grid shared with the workers by fork inheritance (set by run()):
+_grid = None
+
+
+def _build(task):
+    scenario, outdir, overlap, sweep, resume = task
+    return batch_ancil.build_scenario(_grid, scenario, outdir, overlap, sweep, resume)
+
+
+def run(grid, scenarios, outdir='.', processes=None, overlap='first', sweep=None, resume=False):
+    """Build every scenario on a fork-based process pool.
+
+    Yields (output path, total Tg/yr, area m2, written) as each scenario
+    finishes, which is not necessarily in table order. See
+    batch_ancil.build_scenario for sweep and resume.
+    """
+    global _grid
+    _grid = grid
+    ctx = multiprocessing.get_context('fork')
+    with ctx.Pool(processes) as pool:
+        tasks = [(scenario, outdir, overlap, sweep, resume) for scenario in scenarios]
+        for result in pool.imap_unordered(_build, tasks):
+            yield result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build MCB emission ancillaries from a scenario table in parallel.')
+    parser.add_argument('table', help='CSV scenario table (opfile,regions,tgyr)')
+    parser.add_argument('--infile', default=batch_ancil.INFILE, help='template pp-file')
+    parser.add_argument('--landfile', default=batch_ancil.LANDFILE, help='land-fraction pp-file')
+    parser.add_argument('--outdir', default='.', help='directory for the output files')
+    parser.add_argument('--cachedir', help='cache grid areas and masks here between runs')
+    parser.add_argument('--processes', type=int, default=os.cpu_count(), help='number of worker processes')
+    parser.add_argument('--overlap', default='first', choices=region_index.OVERLAP_POLICIES,
+                        help='how points in more than one region are counted')
+    parser.add_argument('--ocean-threshold', type=float,
+                        help='weight by ocean fraction, keeping points with more ocean than this')
+    parser.add_argument('--timings', metavar='JSON',
+                        help='print stage timings and memory use, and save them as JSON here')
+    parser.add_argument('--resume', action='store_true',
+                        help='skip outputs already built from the same definition (see output_store.py)')
+    args = parser.parse_args(argv)
+
+    # Only the parent is timed; the workers' memory isn't included.
+    instrument.begin('parallel_ancil.py', trace=args.timings is not None, **vars(args))
+    scenarios = batch_ancil.read_scenarios(args.table)
+    with instrument.stage('load_grid'):
+        grid = mcb_ancil.load_grid(args.infile, args.landfile, args.cachedir, args.ocean_threshold)
+        # (loaded here, before the workers fork, so they share it)
+        batch_ancil.template_cube(grid)
+    sweep = output_store.make_sweep(args.infile, args.landfile, ocean_threshold=args.ocean_threshold)
+    with instrument.stage('run'):
+        for opfile, total, area, written in run(grid, scenarios, args.outdir, args.processes,
+                                                args.overlap, sweep, args.resume):
+            print('{}: area (million km2) = {:.4f}, total (Tg[sea-salt]/yr) = {:.4f}{}'
+                  .format(opfile, area * 1e-12, total, '' if written else ' (already built)'))
+    if args.timings is not None:
+        instrument.report(args.timings)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,266 @@
+# Lightweight pp-file template reader/writer, for building the emissions
+# without importing iris or loading the template cube.
+#
+# The scripts only use the template (cp109a.pm_2040_jan_to_dec_00024.pp)
+# for its grid, times and headers; its data is thrown away. Here just the
+# 64-word lookup header of each field is read (the file is memory-mapped,
+# so the packed data is never touched), and the output is written as a
+# pp-file with the template's headers, the new STASH code (or codes, for
+# several fields in one file) and unpacked 32-bit data, or WGDOS-packed
+# data (see wgdos.py) for a smaller file. The headers are set up as
+# iris.save would write them.
+#
+# The data of unpacked fields (e.g. the land fraction aw310a) are given
+# as read-only views of the memory-mapped file rather than copies, so
+# many workers on one node share a single page-cached copy of them.
+#
+# Only 32-bit big-endian pp-files (as written by the UM post-processing
+# and by iris) on regular lat-lon grids are handled.
+
+import collections
+import os
+
+import numpy as np
+
+import wgdos
+
+
+# Lookup header: 45 integer words followed by 19 real words.
+NUM_INTS = 45
+NUM_REALS = 19
+
+# Integer word positions (0-based) used here:
+LBYR = 0
+LBMON = 1
+LBDAT = 2
+LBTIM = 12
+LBLREC = 14
+LBROW = 17
+LBNPT = 18
+LBEXT = 19
+LBPACK = 20
+LBFC = 22
+LBVC = 25
+LBEGIN = 28
+LBNREC = 29
+LBPROJ = 30
+LBTYP = 31
+LBLEV = 32
+LBUSER2 = 39
+LBUSER4 = 41
+LBUSER7 = 44
+
+# Real word positions (0-based, within the reals):
+BACC = 5
+BZY = 13
+BDY = 14
+BZX = 15
+BDX = 16
+BMDI = 17
+
+MDI = -1.0e30
+
+# Earth radius used by the UM (and by iris for UM pp-files):
+EARTH_RADIUS = 6371229.0
+
+Template = collections.namedtuple('Template', ['path', 'ints', 'reals', 'lats', 'lons'])
+
+
+def read_lookups(path):
+    """Integer headers, real headers and data word offsets of every field.
+
+    Returns (ints, reals, offsets, lengths): arrays of shape (nfields, 45)
+    and (nfields, 19), and the offset and length (in 32-bit words) of each
+    field's data record in the file.
+    """
+    words = np.memmap(os.path.expanduser(path), dtype='>i4', mode='r')
+    ints, reals, offsets, lengths = [], [], [], []
+    pos = 0
+    while pos < words.size:
+        nhead = words[pos] // 4
+        header = np.array(words[pos + 1:pos + 1 + nhead])
+        pos += nhead + 2
+        ndata = words[pos] // 4
+        ints.append(header[:NUM_INTS])
+        reals.append(header[NUM_INTS:NUM_INTS + NUM_REALS].view('>f4'))
+        offsets.append(pos + 1)
+        lengths.append(ndata)
+        pos += ndata + 2
+    return (np.array(ints, dtype='i4'), np.array(reals, dtype='f4'),
+            np.array(offsets), np.array(lengths))
+
+
+def grid_points(ints, reals):
+    """Latitude and longitude points of a regular grid from one lookup."""
+    nlat, nlon = ints[LBROW], ints[LBNPT]
+    lats = reals[BZY] + reals[BDY] * np.arange(1, nlat + 1, dtype='f8')
+    lons = reals[BZX] + reals[BDX] * np.arange(1, nlon + 1, dtype='f8')
+    return lats, lons
+
+
+def load_template(path, stash=24):
+    """Headers and grid of the fields with section-0 STASH item stash.
+
+    stash=24 matches iris.AttributeConstraint(STASH='m01s00i024').
+    """
+    ints, reals, _, _ = read_lookups(path)
+    keep = (ints[:, LBUSER4] == stash) & (ints[:, LBUSER7] == 1)
+    if not keep.any():
+        raise ValueError('no fields with STASH m01s00i{:03d} in {}'.format(stash, path))
+    ints, reals = ints[keep], reals[keep]
+    lats, lons = grid_points(ints[0], reals[0])
+    return Template(path, ints, reals, lats, lons)
+
+
+def _data_view(words, ints, offset, path, index):
+    # (lat, lon) view of one unpacked field's data in the memory-mapped
+    # file, or an unpacked copy of a WGDOS-packed one.
+    if ints[LBPACK] == wgdos.LBPACK_WGDOS:
+        return wgdos.unpack(words[offset:offset + ints[LBLREC]].view('>u4'))
+    if ints[LBPACK] != 0:
+        raise ValueError('{} field {} is packed (lbpack={}); load it with iris'
+                         .format(path, index, ints[LBPACK]))
+    size = ints[LBROW] * ints[LBNPT]
+    return words[offset:offset + size].reshape(ints[LBROW], ints[LBNPT])
+
+
+def data_views(path):
+    """Headers and data of every unpacked field, without copying.
+
+    Returns (ints, reals, views): the lookup arrays as for read_lookups,
+    and a read-only big-endian 32-bit (lat, lon) view of each field's
+    data in the memory-mapped file (None for packed fields). Pages are
+    only read as they're used, and processes reading the same file share
+    the one copy in the page cache. Use np.array(view, dtype='f8') or
+    similar where a native, writable copy is needed.
+    """
+    ints, reals, offsets, _ = read_lookups(path)
+    words = np.memmap(os.path.expanduser(path), dtype='>f4', mode='r')
+    views = [_data_view(words, ints[k], offsets[k], path, k) if ints[k, LBPACK] == 0 else None
+             for k in range(len(ints))]
+    return ints, reals, views
+
+
+def load_field(path, index=0):
+    """Data of one unpacked (lbpack=0) or WGDOS-packed field as a 2-D
+    (lat, lon) array.
+
+    Unpacked data is a read-only view of the memory-mapped file (see
+    data_views), so nothing is copied until it's used in a calculation.
+    """
+    ints, _, offsets, _ = read_lookups(path)
+    words = np.memmap(os.path.expanduser(path), dtype='>f4', mode='r')
+    return _data_view(words, ints[index], offsets[index], path, index)
+
+
+def iter_fields(path):
+    """Yield (ints, reals, data) for each field of a pp-file in turn.
+
+    Unpacked data are read-only views of the memory-mapped file (see
+    data_views), so only the pages of the field being used are read;
+    WGDOS-packed fields are unpacked one at a time.
+    """
+    ints, reals, offsets, _ = read_lookups(path)
+    words = np.memmap(os.path.expanduser(path), dtype='>f4', mode='r')
+    for k in range(len(ints)):
+        yield ints[k], reals[k], _data_view(words, ints[k], offsets[k], path, k)
+
+
+def _bounds(points):
+    # Same as iris guess_bounds(): halfway between points, with the end
+    # bounds half a spacing out from the end points.
+    mid = 0.5 * (points[1:] + points[:-1])
+    return np.concatenate([[2 * points[0] - mid[0]], mid, [2 * points[-1] - mid[-1]]])
+
+
+def area_weights(lats, lons, radius=EARTH_RADIUS):
+    """Gridbox areas (m2), as iris.analysis.cartography.area_weights gives
+    for the template cube after guess_bounds()."""
+    lat_b = np.radians(np.clip(_bounds(np.asarray(lats, dtype='f8')), -90., 90.))
+    lon_b = np.radians(_bounds(np.asarray(lons, dtype='f8')))
+    dsin = np.abs(np.diff(np.sin(lat_b)))
+    dlon = np.abs(np.diff(lon_b))
+    return radius**2 * dsin[:, np.newaxis] * dlon[np.newaxis, :]
+
+
+def output_headers(template, stash=301):
+    """Template headers turned into those of an unpacked STASH-stash field."""
+    ints = template.ints.copy()
+    reals = template.reals.copy()
+    ints[:, LBLREC] = ints[:, LBROW] * ints[:, LBNPT]
+    ints[:, LBEXT] = 0
+    ints[:, LBPACK] = 0
+    ints[:, LBFC] = 0
+    ints[:, LBVC] = 0
+    ints[:, LBEGIN] = 0
+    ints[:, LBNREC] = 0
+    ints[:, LBPROJ] = 0
+    ints[:, LBTYP] = 0
+    ints[:, LBLEV] = 0
+    ints[:, LBUSER2] = -99
+    ints[:, LBUSER4] = stash
+    reals[:, BACC] = 0.0
+    reals[:, BMDI] = MDI
+    return ints, reals
+
+
+def _write_field(f, ints, reals, field):
+    # One field record (header, then big-endian 32-bit data) in pp-file layout.
+    header = np.concatenate([ints.astype('>i4'), reals.astype('>f4').view('>i4')]).astype('>i4')
+    np.array([header.nbytes], dtype='>i4').tofile(f)
+    header.tofile(f)
+    np.array([header.nbytes, field.nbytes], dtype='>i4').tofile(f)
+    field.tofile(f)
+    np.array([field.nbytes], dtype='>i4').tofile(f)
+
+
+def _packed(ints, reals, field, wgdos_bits):
+    # Headers and data words of a field, WGDOS-packed if wgdos_bits is set.
+    if wgdos_bits is None:
+        return ints, reals, np.ma.filled(field, MDI).astype('>f4')
+    field = np.ma.filled(field, np.nan)
+    acc = wgdos.accuracy(field, wgdos_bits)
+    words = wgdos.pack(field, acc)
+    ints, reals = ints.copy(), reals.copy()
+    ints[LBPACK] = wgdos.LBPACK_WGDOS
+    ints[LBLREC] = len(words)
+    reals[BACC] = acc
+    return ints, reals, words
+
+
+def save_pp(template, data, opfile, stash=301, wgdos_bits=None):
+    """Write emissions as a pp-file with the template's grid and times.
+
+    data is either one 2-D (lat, lon) field, used for every time, or a
+    sequence of 2-D fields, one per template time. With wgdos_bits the
+    fields are WGDOS-packed, keeping that many significant bits of each
+    field's largest value (see wgdos.py): each value is then within
+    2**(acc - 1) of the original, about 1e-7 of the largest at 24 bits,
+    not the full 32-bit precision of smaller values.
+    """
+    save_pp_fields(template, [(stash, data)], opfile, wgdos_bits)
+
+
+def save_pp_fields(template, fields, opfile, wgdos_bits=None):
+    """Write several fields (e.g. species) to one pp-file.
+
+    fields is a list of (stash, data) pairs, data as for save_pp. The
+    fields are written time by time, all of them for each time in turn,
+    as in a UM ancillary with several field types. Raises ValueError if
+    a sequence of fields isn't one per template time, or if opfile ends
+    in .anc or .nc.
+    """
+    if opfile.endswith(('.anc', '.nc')):
+        raise ValueError('{} would be a pp-file with a .anc/.nc name; write it with '
+                         'mcb_ancil.write_ancil (or ancil_writer.py) instead'.format(opfile))
+    headers = [output_headers(template, stash) for stash, _ in fields]
+    ntimes = len(template.ints)
+    data = [[d] * ntimes if np.ndim(d) == 2 else d for _, d in fields]
+    for (stash, _), d in zip(fields, data):
+        if len(d) != ntimes:
+            raise ValueError('STASH {}: {} fields for the {} times of the template'
+                             .format(stash, len(d), ntimes))
+    with open(os.path.expanduser(opfile), 'wb') as f:
+        for t, step in enumerate(zip(*data)):
+            for (ints, reals), field in zip(headers, step):
+                _write_field(f, *_packed(ints[t], reals[t], field, wgdos_bits))
@@ -0,0 +1,106 @@
+# Solve for the emission field that gives each region a target amount
+# (Tg/yr), for any number of regions and any overlap policy.
+#
+# Within region r the flux at point c is k_r * w_c, where w_c is an
+# optional spatial weighting (1 by default, i.e. uniform flux as in the
+# scripts). Region r's emissions are then k_r * sum_c(w_c * area_c) over
+# the points it counts (see region_index.py), so
+#
+#    k_r = target_r / sum_c(w_c * area_c)
+#
+# and the field is a fixed sparse (points x regions) matrix times k. The
+# matrix is kept as the region index's (point, region, weight) entries
+# for just the points in some region, sorted by point, so it grows with
+# the regions' points rather than points x regions (a dense matrix for
+# 128 regions at N1280 would be over 2 GB). It and the effective areas
+# are set up once per region set by make_solver(); after that each rate
+# vector - or a whole stack of them at once - costs one division, one
+# gather and one np.add.reduceat over the entries, with no Python loops.
+
+import collections
+
+import numpy as np
+
+
+# Seconds in a (360-day) model year, for converting Tg/yr to kg/s:
+SECS_PER_YEAR = 60.*60.*24.*360.
+
+# support holds the grid points (flat indices) in some region, and the
+# entries of support[i] are regions[indptr[i]:indptr[i + 1]] with their
+# weights; areas are the regions' effective areas (m2).
+Solver = collections.namedtuple('Solver', ['shape', 'support', 'indptr', 'regions', 'weights', 'areas'])
+
+
+def make_solver(index, grid_areas, weights=None):
+    """Set up the solve for a region index (see region_index.py).
+
+    weights is an optional (lat, lon) array of relative flux within each
+    region (e.g. to favour some points); it needn't be normalised.
+    """
+    w = index.weights
+    if weights is not None:
+        w = w * np.ravel(weights)[index.points]
+    areas = np.bincount(index.regions, weights=w * np.ravel(grid_areas)[index.points],
+                        minlength=index.nregions)
+    # Only entries with some weight are kept; "support" maps their points back to the grid.
+    keep = w != 0
+    points, regions, w = index.points[keep], index.regions[keep], w[keep]
+    # The entries are sorted by point, so each point's run starts where it first appears:
+    support, starts = np.unique(points, return_index=True)
+    indptr = np.append(starts, len(points))
+    return Solver(index.shape, support, indptr, regions, w, areas)
+
+
+def region_coefficients(solver, targets):
+    """k for target emissions (Tg/yr), shape (..., nregions)."""
+    targets = np.asarray(targets, dtype='f8')
+    empty = solver.areas == 0
+    if np.any(targets[..., empty] != 0):
+        raise ValueError('non-zero target for region(s) {} with no ocean points'
+                         .format(list(np.flatnonzero(empty))))
+    areas = np.where(empty, 1.0, solver.areas)
+    return targets * 1.0e9 / SECS_PER_YEAR / areas
+
+
+def support_fluxes(solver, targets):
+    """Fluxes (kg m-2 s-1) at just the points in some region.
+
+    Shape (..., len(solver.support)); cheaper than solve() for many rate
+    vectors when only the region points are needed.
+    """
+    coefficients = region_coefficients(solver, targets)
+    contrib = solver.weights * coefficients[..., solver.regions]
+    if not len(solver.support):
+        return contrib
+    return np.add.reduceat(contrib, solver.indptr[:-1], axis=-1)
+
+
+def solve(solver, targets):
+    """Emission field(s) in kg m-2 s-1 for target emissions in Tg/yr.
+
+    targets has shape (nregions,) for one (lat, lon) field, or
+    (nvectors, nregions) for a (nvectors, lat, lon) stack of them.
+    """
+    flux = support_fluxes(solver, targets)
+    fields = np.zeros(flux.shape[:-1] + (int(np.prod(solver.shape)),))
+    fields[..., solver.support] = flux
+    return fields.reshape(flux.shape[:-1] + solver.shape)
+
+
+def total_tgyr(field, grid_areas):
+    """Global total (Tg/yr) of an emission field in kg m-2 s-1."""
+    return np.sum(field * grid_areas, axis=(-2, -1)) * SECS_PER_YEAR * 1e-9
+
+
+def check_total(total, targets, rtol=1e-5):
+    """Raise ValueError unless a total (Tg/yr) matches the summed targets.
+
+    Use it on the total from the output cube itself, e.g.
+    cube[0].collapsed(['longitude', 'latitude'], iris.analysis.SUM,
+    weights=grid_areas), converted to Tg/yr. The default tolerance
+    allows for the 32-bit output data.
+    """
+    expected = np.sum(targets)
+    if not np.isclose(total, expected, rtol=rtol, atol=0):
+        raise ValueError('total emissions {} Tg/yr do not match the target {} Tg/yr'
+                         .format(total, expected))
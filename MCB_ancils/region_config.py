@@ -0,0 +1,187 @@
+# Regions read from files instead of the R1-R16 lists in regions.py:
+# boxes and polygons from a JSON/YAML config, or the polygons of a
+# GeoJSON file (e.g. outlines of the stratocumulus decks).
+#
+# A config file lists the regions in order:
+#
+#    {"regions": [
+#      {"name": "NEP", "box": [210, 0, 250, 30]},
+#      {"name": "SEP deck", "polygon": [[250, -30], [290, -30], [280, 0], [255, 0]]},
+#      {"geojson": "decks.geojson"}
+#    ]}
+#
+# (or the same in YAML, which needs PyYAML). Boxes are [W, S, E, N] as in
+# regions.py; polygons are lists of [lon, lat] vertices. Each feature of
+# a GeoJSON file (Polygon or MultiPolygon, holes allowed) becomes one
+# region, named after its "name" property; a GeoJSON file can also be
+# given directly.
+#
+# As in GeoJSON (RFC 7946), polygon edges are straight lines in lon/lat,
+# taken as written: [[100, -10], [300, -10], [300, 10], [100, 10]] is a
+# band 200 degrees wide, not the 160 degrees the other way round, and
+# [[-180, 50], [180, 50], [180, 80], [-180, 80]] goes all the way round.
+# A polygon crossing the date line or the Greenwich meridian is given
+# with longitudes running on past it (e.g. 170 to 190, or -10 to 10) or
+# split in two, as GeoJSON files do; the grid's longitudes are matched
+# to the polygon's whatever range (-180 to 180, 0 to 360) either uses.
+#
+# Polygons are rasterised onto the grid with a scanline point-in-polygon
+# test: for each latitude row the crossings of every edge are found at
+# once, and each point's crossing count comes from one np.searchsorted
+# over the sorted crossings of all rows. With a cache directory the
+# resulting masks are stored (see grid_cache.py) under a hash of the
+# polygon, so each is only rasterised once per grid.
+
+import collections
+import hashlib
+import json
+import os
+
+import numpy as np
+
+import grid_cache
+import region_mask
+
+
+Region = collections.namedtuple('Region', ['name', 'box', 'polygons'])
+
+# Scanline keys: x + _XOFF + row * _ROW, with _XOFF making all x
+# positive and _NONE placing rows' unused crossings after any real x.
+_XOFF = 1000.
+_NONE = 5000.
+_ROW = 10000.
+
+
+def read_config(path):
+    """Contents of a JSON or YAML file (YAML needs PyYAML)."""
+    with open(os.path.expanduser(path)) as f:
+        if path.endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError('reading {} needs PyYAML ("pip install pyyaml")'.format(path))
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+def _geometry_polygons(geometry):
+    # List of polygons, each a list of (n, 2) [lon, lat] rings.
+    if geometry['type'] == 'Polygon':
+        polygons = [geometry['coordinates']]
+    elif geometry['type'] == 'MultiPolygon':
+        polygons = geometry['coordinates']
+    else:
+        raise ValueError('unsupported GeoJSON geometry {!r} (need Polygon or MultiPolygon)'
+                         .format(geometry['type']))
+    return [[np.asarray(ring, dtype='f8')[:, :2] for ring in polygon] for polygon in polygons]
+
+
+def geojson_regions(data):
+    """One Region per feature of a GeoJSON FeatureCollection (or Feature)."""
+    features = data['features'] if data['type'] == 'FeatureCollection' else [data]
+    regions = []
+    for k, feature in enumerate(features):
+        name = (feature.get('properties') or {}).get('name', 'feature{}'.format(k + 1))
+        regions.append(Region(name, None, _geometry_polygons(feature['geometry'])))
+    return regions
+
+
+def load_regions(path):
+    """List of Regions from a JSON/YAML config or a GeoJSON file."""
+    data = read_config(path)
+    if data.get('type') in ('FeatureCollection', 'Feature'):
+        return geojson_regions(data)
+    regions = []
+    for k, entry in enumerate(data['regions']):
+        if 'geojson' in entry:
+            geofile = os.path.join(os.path.dirname(path), os.path.expanduser(entry['geojson']))
+            regions.extend(geojson_regions(read_config(geofile)))
+            continue
+        name = entry.get('name', 'region{}'.format(k + 1))
+        if 'box' in entry:
+            regions.append(Region(name, [float(b) for b in entry['box']], None))
+        elif 'polygon' in entry:
+            regions.append(Region(name, None, [[np.asarray(entry['polygon'], dtype='f8')]]))
+        else:
+            raise ValueError('{}: region {!r} needs a box, polygon or geojson'.format(path, name))
+    return regions
+
+
+def _edges(rings):
+    # Start and end points of every edge of a polygon's rings, with the
+    # longitudes as given (edges are straight lines in lon/lat).
+    x0, y0, x1, y1 = [], [], [], []
+    for ring in rings:
+        ring = np.asarray(ring, dtype='f8')[:, :2]
+        if not np.array_equal(ring[0], ring[-1]):
+            ring = np.vstack([ring, ring[:1]])
+        x0.append(ring[:-1, 0])
+        x1.append(ring[1:, 0])
+        y0.append(ring[:-1, 1])
+        y1.append(ring[1:, 1])
+    return [np.concatenate(a) for a in (x0, y0, x1, y1)]
+
+
+def polygon_mask(lats, lons, rings):
+    """Boolean (lat, lon) mask of the points inside a polygon.
+
+    rings are (n, 2) arrays of [lon, lat] vertices: the outline and any
+    holes (points inside an odd number of rings are in the polygon).
+    """
+    lats = region_mask._points(lats).astype('f8')
+    lons = region_mask._points(lons).astype('f8')
+    x0, y0, x1, y1 = _edges(rings)
+    if x0.min() < -720. or x0.max() > 720.:
+        raise ValueError('polygon longitudes beyond +/-720 degrees')
+
+    # Crossings of each edge with each latitude row, half-open in
+    # latitude so a vertex on a row is counted once:
+    y = lats[:, np.newaxis]
+    crosses = (y0 <= y) != (y1 <= y)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x = x0 + (y - y0) * (x1 - x0) / (y1 - y0)
+    row = np.arange(len(lats))[:, np.newaxis] * _ROW
+    keys = np.where(crosses, x + _XOFF, _NONE) + row
+    keys.sort(axis=1)
+    keys = keys.ravel()
+    ncross = crosses.sum(axis=1)[:, np.newaxis]
+    first = np.arange(len(lats))[:, np.newaxis] * x0.size
+
+    # A point is inside if an odd number of crossings lie east of it, at
+    # any of its longitudes 360 apart within the polygon's range:
+    mask = np.zeros((len(lats), len(lons)), dtype=bool)
+    first_shift = np.floor((x0.min() - lons.max()) / 360.)
+    last_shift = np.ceil((x0.max() - lons.min()) / 360.)
+    for shift in 360. * np.arange(first_shift, last_shift + 1):
+        # (points beyond the polygon's ends are outside, so clip them to
+        # just past the ends to keep their keys in their own row):
+        query = np.clip(lons + shift, x0.min() - 1., x0.max() + 1.)[np.newaxis, :] + _XOFF + row
+        west = np.searchsorted(keys, query.ravel(), side='right').reshape(query.shape) - first
+        mask |= (ncross - west) % 2 == 1
+    return mask
+
+
+def region_mask_of(lats, lons, region):
+    """Boolean (lat, lon) mask of a Region, box or [W, S, E, N] list."""
+    if not isinstance(region, Region):
+        return region_mask.box_mask(lats, lons, region)
+    if region.box is not None:
+        return region_mask.box_mask(lats, lons, region.box)
+    mask = np.zeros((len(region_mask._points(lats)), len(region_mask._points(lons))), dtype=bool)
+    for rings in region.polygons:
+        mask |= polygon_mask(lats, lons, rings)
+    return mask
+
+
+def cache_name(region):
+    """grid_cache entry name for a region's points."""
+    if not isinstance(region, Region):
+        return grid_cache.box_name(region)
+    if region.box is not None:
+        return grid_cache.box_name(region.box)
+    h = hashlib.sha1()
+    for rings in region.polygons:
+        for ring in rings:
+            h.update(np.ascontiguousarray(ring, dtype='f8').tobytes())
+        h.update(b'|')
+    return 'polygon_' + h.hexdigest()[:16]
@@ -0,0 +1,96 @@
+# Sparse index of which grid points belong to which regions.
+#
+# Built once per grid from the points of each region (see
+# region_mask.box_points), or from a stack of region masks, it stores one (point, region, weight) entry for every point in every
+# region, sorted by point, so only points that are in some region take
+# up space. Region areas, the union area and the emission field all
+# come from single passes over these entries (np.bincount), whatever
+# the number of regions or size of the boxes.
+#
+# Where regions overlap, the weights say how a shared point is treated:
+#
+#   'first'  the point belongs only to the first region containing it
+#            (the "overlap" array in bdd_ancil.py)
+#   'sum'    the point belongs fully to every region containing it, so
+#            the fluxes add up there (R7 "+=" in create_ancil.py)
+#   'split'  the point's area is shared equally between its regions
+#
+# With any policy, each region's emissions (flux x its area as counted
+# here) add up to the global total of the field exactly.
+
+import collections
+
+import numpy as np
+
+
+OVERLAP_POLICIES = ('first', 'sum', 'split')
+
+RegionIndex = collections.namedtuple(
+    'RegionIndex', ['shape', 'nregions', 'points', 'regions', 'weights', 'indptr'])
+
+
+def build_index(masks, overlap='first'):
+    """Index a (nregions, nlat, nlon) stack of boolean region masks."""
+    masks = np.asarray(masks, dtype=bool)
+    return index_points(masks.shape[1:], [np.flatnonzero(m) for m in masks], overlap)
+
+
+def index_points(shape, region_points, overlap='first'):
+    """Index regions given as arrays of flat (lat * nlon + lon) point
+    indices, one per region, on a grid of this (nlat, nlon) shape.
+    """
+    if overlap not in OVERLAP_POLICIES:
+        raise ValueError('overlap must be one of {}, not {!r}'.format(OVERLAP_POLICIES, overlap))
+    shape = tuple(shape)
+    nregions = len(region_points)
+    points = np.concatenate([np.zeros(0, dtype='i8')] +
+                            [np.asarray(p, dtype='i8') for p in region_points])
+    regions = np.repeat(np.arange(nregions), [len(p) for p in region_points])
+
+    # A stable sort by point keeps each point's entries in region order,
+    # so the first entry of each point is its first region:
+    order = np.argsort(points, kind='stable')
+    points, regions = points[order], regions[order]
+    n = np.bincount(points, minlength=int(np.prod(shape)))
+    indptr = np.concatenate([[0], np.cumsum(n)])
+
+    if overlap == 'first':
+        weights = np.zeros(len(points))
+        weights[indptr[:-1][n > 0]] = 1.0
+    elif overlap == 'sum':
+        weights = np.ones(len(points))
+    else:
+        weights = 1.0 / n[points]
+    return RegionIndex(shape, nregions, points, regions, weights, indptr)
+
+
+def counts(index):
+    """Number of regions each point is in, as a (lat, lon) array."""
+    return np.diff(index.indptr).reshape(index.shape)
+
+
+def labels(index):
+    """(lat, lon) array of the first region each point is in (-1 for none)."""
+    out = np.full(int(np.prod(index.shape)), -1)
+    n = np.diff(index.indptr)
+    out[n > 0] = index.regions[index.indptr[:-1][n > 0]]
+    return out.reshape(index.shape)
+
+
+def region_areas(index, grid_areas):
+    """Area (m2) each region counts, allowing for overlaps."""
+    area = np.ravel(grid_areas)[index.points]
+    return np.bincount(index.regions, weights=index.weights * area, minlength=index.nregions)
+
+
+def union_area(index, grid_areas):
+    """Area (m2) covered by at least one region, with overlaps counted once."""
+    return np.sum(grid_areas, where=counts(index) > 0)
+
+
+def region_field(index, fluxes):
+    """2-D field from one flux per region, combined as the policy says."""
+    fluxes = np.asarray(fluxes, dtype='f8')
+    size = int(np.prod(index.shape))
+    field = np.bincount(index.points, weights=index.weights * fluxes[index.regions], minlength=size)
+    return field.reshape(index.shape)
@@ -0,0 +1,166 @@
+# Vectorised region masks for the MCB ancillary scripts.
+#
+# Replaces the nested "for i in lat_indices: for j in lon_indices" loops
+# in create_ancil.py and bdd_ancil.py with boolean (lat, lon) masks built
+# by numpy broadcasting. Regions are boxes [W, S, E, N] as in the scripts,
+# with all longitudes in degrees East.
+#
+# Longitudes are compared modulo 360, so a box can run across the
+# Greenwich meridian by giving W > E (e.g. [335, -30, 15, 0] for the
+# South-East Atlantic) rather than being split in two, and it doesn't
+# matter whether the grid runs 0 to 360 or -180 to 180. A box with
+# E - W >= 360 covers all longitudes.
+#
+# Boxes are half-open, [W, E) x [S, N): a grid point on a box's eastern
+# or northern edge belongs to the neighbouring box, so boxes that share
+# an edge (R5 and R6 at the meridian, R1 and R3 at 30N, ...) never both
+# hold a point on it, and it isn't counted twice with overlap='sum'
+# (see region_index.py). A northern edge at 90N takes in the pole.
+
+import numpy as np
+
+
+def _points(coord):
+    # Accept an iris DimCoord or a plain array of points.
+    return np.asarray(getattr(coord, 'points', coord))
+
+
+def _lon_in(lons, west, east):
+    # (..., nlon) mask of lons in [west, east) going east from west,
+    # for arrays of west and east of shape (...,).
+    west = np.asarray(west, dtype='f8')[..., np.newaxis]
+    east = np.asarray(east, dtype='f8')[..., np.newaxis]
+    width = np.where(east - west >= 360., 360., (east - west) % 360.)
+    return (lons - west) % 360. < width
+
+
+def _lat_in(lats, south, north):
+    # (..., nlat) mask of lats in [south, north), or [south, 90] at the
+    # pole, for arrays of south and north of shape (...,).
+    south = np.asarray(south, dtype='f8')[..., np.newaxis]
+    north = np.asarray(north, dtype='f8')[..., np.newaxis]
+    return (lats >= south) & ((lats < north) | (north >= 90.))
+
+
+def box_mask(lats, lons, box):
+    """Boolean (lat, lon) mask of the grid points inside box [W, S, E, N) (see top)."""
+    lats = _points(lats)
+    lons = _points(lons)
+    lat_in = _lat_in(lats, box[1], box[3])
+    lon_in = _lon_in(lons, box[0], box[2])
+    return lat_in[:, np.newaxis] & lon_in[np.newaxis, :]
+
+
+def box_points(lats, lons, box, ocean=None):
+    """Flat (lat * nlon + lon) indices of the grid points inside box, sorted.
+
+    Made from the box's latitude and longitude index ranges, so it costs
+    the number of points in the box rather than a whole-grid mask. If an
+    ocean mask is given, points outside it are left out.
+    """
+    lats = _points(lats)
+    lons = _points(lons)
+    rows = np.flatnonzero(_lat_in(lats, box[1], box[3]))
+    cols = np.flatnonzero(_lon_in(lons, box[0], box[2]))
+    points = (rows[:, np.newaxis] * len(lons) + cols[np.newaxis, :]).ravel()
+    if ocean is not None:
+        points = points[np.ravel(ocean)[points]]
+    return points
+
+
+def _land(land_frac):
+    # Data of a land-fraction cube, or the (possibly masked) array itself;
+    # not copied, so a memory-mapped view (pp_template.load_field) stays one.
+    if isinstance(land_frac, np.ndarray):
+        return np.ma.asarray(land_frac)
+    return np.ma.asarray(land_frac.data)
+
+
+def ocean_mask(land_frac):
+    """Boolean (lat, lon) mask of all-ocean points (land fraction exactly 0).
+
+    Masked land-fraction points count as not ocean, as they did in the
+    original "if land_frac.data[i, j] == 0.0" test.
+    """
+    return np.ma.filled(_land(land_frac) == 0.0, False)
+
+
+def ocean_fraction(land_frac, threshold=0.0):
+    """(lat, lon) ocean fraction (1 - land fraction), as emission weights.
+
+    Points whose ocean fraction is threshold or less (and masked points)
+    get 0, so threshold=0 keeps every point with any ocean; with
+    ocean_fraction(...) > 0 as the ocean mask, coastal points count in
+    proportion to their ocean area rather than being dropped.
+    """
+    frac = np.ma.filled(1.0 - _land(land_frac).astype('f8'), 0.0)
+    return np.where(frac > threshold, frac, 0.0)
+
+
+def ocean_weights(land_frac, threshold=None):
+    """Ocean weights for the regions' areas, fields and totals.
+
+    With threshold None these are 1 on all-ocean points and 0 elsewhere
+    (the exact-zero land test); otherwise see ocean_fraction().
+    """
+    if threshold is None:
+        return ocean_mask(land_frac).astype('f8')
+    return ocean_fraction(land_frac, threshold)
+
+
+def region_masks(lats, lons, boxes, ocean=None):
+    """Stack of region masks, shape (nregions, nlat, nlon), in one pass.
+
+    If an ocean mask is given, points outside it are excluded.
+    """
+    boxes = np.asarray(boxes, dtype='f8').reshape(-1, 4)
+    lats = _points(lats)
+    lat_in = _lat_in(lats, boxes[:, 1], boxes[:, 3])
+    lon_in = _lon_in(_points(lons), boxes[:, 0], boxes[:, 2])
+    masks = lat_in[:, :, np.newaxis] & lon_in[:, np.newaxis, :]
+    if ocean is not None:
+        masks &= ocean
+    return masks
+
+
+def first_wins(masks):
+    """Remove from each mask the points already claimed by earlier masks.
+
+    Equivalent to the "overlap" array in bdd_ancil.py, where a point only
+    counts towards the area of the first region that reaches it.
+    """
+    claimed = np.logical_or.accumulate(masks, axis=0)
+    out = masks.copy()
+    out[1:] &= ~claimed[:-1]
+    return out
+
+
+def masked_area(mask, grid_areas):
+    """Total area (m2) of the points in a single (lat, lon) mask."""
+    return np.sum(grid_areas, where=mask)
+
+
+def masked_areas(masks, grid_areas):
+    """Area (m2) of each mask in a (nregions, nlat, nlon) stack."""
+    return np.tensordot(masks, grid_areas, axes=2)
+
+
+def fill_time_series(data, field):
+    """Write a 2-D (lat, lon) field into every time of a (time, lat, lon) array."""
+    data[...] = field[np.newaxis, :, :]
+    return data
+
+
+def lazy_time_series(field, shape, dtype=None, chunks=None):
+    """Lazy (time, lat, lon) dask array with the 2-D field at every time.
+
+    Only the 2-D field is held in memory; each time (one chunk per time
+    by default) is produced when it's computed, e.g. as iris.save writes
+    the cube out field by field.
+    """
+    # dask comes with iris, so only needed here rather than at the top.
+    import dask.array as da
+    field = np.asarray(field, dtype=dtype)
+    if chunks is None:
+        chunks = (1,) + field.shape
+    return da.broadcast_to(da.from_array(field, chunks=field.shape), shape, chunks=chunks)
@@ -0,0 +1,60 @@
+# Region definitions for the MCB ancillary scripts (R1-R16), shared by
+# bdd_ancil.py and batch_ancil.py.
+
+# Define region limits [W, S, E, N]
+# =================================
+# All longitudes are specified in degrees East. A box can cross the
+# Greenwich meridian by giving W > E, e.g. [335, -30, 15, 0]; see
+# region_mask.py. E - W = 360 means all longitudes. Boxes include their
+# western and southern edges but not their eastern and northern ones, so
+# neighbouring boxes never share a grid point.
+
+# R1 (North-East Pacfic): 
+R1 = [210, 0, 250, 30]
+
+# R2 (South-East Pacific): 
+R2 = [250, -30, 290, 0]
+
+# R3 (North Pacific): 
+R3 = [170, 30, 240, 50]
+
+# R4 (South Pacific): 
+R4 = [190, -50, 270, -30]
+
+# R5-6 (South-East Atlantic - straddles the Greenwich meridian):
+# kept as two regions, split exactly at the meridian, so region numbers
+# in existing scenarios don't change (there used to be a gap between
+# 359.5 and 0.5, which only matters on grids with points in it).
+R5 = [335, -30, 360, 0]
+R6 = [0, -30, 15, 0]
+
+# R7 (Western North Pacific):
+R7 = [140, 30, 210, 50]
+
+# R8 (North-West Pacific)
+R8 = [120, 0, 160, 30]
+
+# R9 (South-West Pacific)
+R9 = [150, -30, 190, 0]
+
+# R10-11 (South Atlantic - straddles the Greenwich meridian, split as R5-6):
+R10 = [305, -50, 360, -30]
+R11 = [0, -50, 15, -30]
+
+# R12 (North-West Atlantic)
+R12 = [290, 0, 335, 30]
+
+# R13 (North Atlantic)
+R13 = [290, 30, 360, 50]
+
+# R14 (South-East Indian Ocean)
+R14 = [70, -30, 110, 0]
+
+# R15 (Northern Indian Ocean)
+R15 = [45, 0, 100, 30]
+
+# R16 (Northern Oceans - extended):
+R16 = [0, 50, 360, 80]
+
+# So you can just pick a region out of an array (rs[n-1] is Rn):
+rs=[R1,R2,R3,R4,R5,R6,R7,R8,R9,R10,R11,R12,R13,R14,R15,R16]
@@ -0,0 +1,158 @@
+# Conservative (area-weighted) regridding of emission fields between
+# regular lat-lon grids, e.g. from the N96 template grid to N216 or N512.
+#
+# => python3 regrid.py NO_50Tg_MCB.pp n216_grid.pp NO_50Tg_MCB_n216.pp
+#
+# A target box gets the area-weighted mean flux of the source boxes it
+# overlaps, so each source box's emissions (flux x area) are shared out
+# exactly by overlap area and the global Tg/yr total is unchanged. On a
+# regular grid the overlap of two boxes is the product of their latitude
+# overlap (in sin(lat)) and longitude overlap, so the weights come from
+# two small 1-D overlap tables. They're stored sparsely as (target,
+# source, weight) entries sorted by target, and applying them to one
+# field or a whole stack is a single sparse mat-vec (np.add.reduceat).
+#
+# With a cachedir the weights are kept on disk (see grid_cache.py), keyed
+# on both grids, so each further regrid between the same grids costs
+# just the mat-vec.
+
+import argparse
+import collections
+
+import numpy as np
+
+import grid_cache
+import pp_template
+import rate_solver
+
+
+Weights = collections.namedtuple('Weights', ['src_shape', 'tgt_shape', 'rows', 'cols', 'weights', 'indptr'])
+
+
+def _lat_bounds(lats):
+    return np.sin(np.radians(np.clip(pp_template._bounds(np.asarray(lats, dtype='f8')), -90., 90.)))
+
+
+def _lon_bounds(lons):
+    return np.radians(pp_template._bounds(np.asarray(lons, dtype='f8')))
+
+
+def overlaps_1d(src_bounds, tgt_bounds, period=None):
+    """(target, source, length) of every non-zero overlap of two sets of
+    1-D cells given by their bounds. With a period (2 pi for longitude)
+    the cells wrap round, whatever the offset between the two grids.
+    """
+    src_lo, src_hi = np.minimum(src_bounds[:-1], src_bounds[1:]), np.maximum(src_bounds[:-1], src_bounds[1:])
+    tgt_lo, tgt_hi = np.minimum(tgt_bounds[:-1], tgt_bounds[1:]), np.maximum(tgt_bounds[:-1], tgt_bounds[1:])
+    shifts = [0.0] if period is None else [-period, 0.0, period]
+    length = np.zeros((len(tgt_lo), len(src_lo)))
+    for shift in shifts:
+        lo = np.maximum(tgt_lo[:, np.newaxis], src_lo[np.newaxis, :] + shift)
+        hi = np.minimum(tgt_hi[:, np.newaxis], src_hi[np.newaxis, :] + shift)
+        length += np.maximum(hi - lo, 0.0)
+    rows, cols = np.nonzero(length)
+    return rows, cols, length[rows, cols]
+
+
+def make_weights(src_lats, src_lons, tgt_lats, tgt_lons):
+    """Sparse conservative regridding weights between two regular grids."""
+    lat_rows, lat_cols, dsin = overlaps_1d(_lat_bounds(src_lats), _lat_bounds(tgt_lats))
+    lon_rows, lon_cols, dlon = overlaps_1d(_lon_bounds(src_lons), _lon_bounds(tgt_lons), 2 * np.pi)
+    nlon_src, nlon_tgt = len(src_lons), len(tgt_lons)
+
+    # Every latitude overlap with every longitude overlap; lat_rows come
+    # out of np.nonzero sorted, and so the 2-D rows are sorted too:
+    rows = (lat_rows[:, np.newaxis] * nlon_tgt + lon_rows[np.newaxis, :]).ravel()
+    cols = (lat_cols[:, np.newaxis] * nlon_src + lon_cols[np.newaxis, :]).ravel()
+    overlap = (dsin[:, np.newaxis] * dlon[np.newaxis, :]).ravel()
+    order = np.argsort(rows, kind='stable')
+    rows, cols, overlap = rows[order], cols[order], overlap[order]
+
+    # Dividing by the target areas as the sums of their overlaps (rather
+    # than recomputing them) makes the weights conserve to rounding:
+    tgt_shape = (len(tgt_lats), len(tgt_lons))
+    tgt_area = np.bincount(rows, weights=overlap, minlength=int(np.prod(tgt_shape)))
+    n = np.bincount(rows, minlength=int(np.prod(tgt_shape)))
+    indptr = np.concatenate([[0], np.cumsum(n)])
+    return Weights((len(src_lats), len(src_lons)), tgt_shape,
+                   rows, cols, overlap / tgt_area[rows], indptr)
+
+
+def cached_weights(cachedir, src_lats, src_lons, tgt_lats, tgt_lons):
+    """make_weights(), kept on disk under cachedir between runs."""
+    if cachedir is None:
+        return make_weights(src_lats, src_lons, tgt_lats, tgt_lons)
+    path = grid_cache.cache_path(cachedir, [src_lats, src_lons, tgt_lats, tgt_lons])
+    made = []
+
+    def compute(name):
+        # Work the weights out at most once, whichever entries are missing:
+        if not made:
+            made.append(make_weights(src_lats, src_lons, tgt_lats, tgt_lons))
+        return getattr(made[0], name)
+
+    arrays = [grid_cache.cached_array(path, 'regrid_' + name, lambda: compute(name))
+              for name in ('rows', 'cols', 'weights', 'indptr')]
+    return Weights((len(src_lats), len(src_lons)), (len(tgt_lats), len(tgt_lons)), *arrays)
+
+
+def regrid(weights, data):
+    """Regrid a (..., lat, lon) field or stack of fields."""
+    data = np.asarray(data)
+    lead = data.shape[:-2]
+    src = data.reshape((-1, int(np.prod(weights.src_shape))))
+    contrib = src[:, weights.cols] * weights.weights
+    out = np.zeros((src.shape[0], int(np.prod(weights.tgt_shape))))
+    nonempty = np.diff(weights.indptr) > 0
+    out[:, nonempty] = np.add.reduceat(contrib, weights.indptr[:-1][nonempty], axis=1)
+    return out.reshape(lead + weights.tgt_shape)
+
+
+def target_template(source, target):
+    """Headers of the source fields with the grid of the target (Templates)."""
+    ints, reals = source.ints.copy(), source.reals.copy()
+    ints[:, pp_template.LBROW] = target.ints[0, pp_template.LBROW]
+    ints[:, pp_template.LBNPT] = target.ints[0, pp_template.LBNPT]
+    for word in (pp_template.BZY, pp_template.BDY, pp_template.BZX, pp_template.BDX):
+        reals[:, word] = target.reals[0, word]
+    return pp_template.Template(source.path, ints, reals, target.lats, target.lons)
+
+
+def regrid_pp(infile, gridfile, opfile, stash=301, grid_stash=None, cachedir=None):
+    """Regrid every STASH-stash field of a pp-file onto the grid of gridfile.
+
+    Returns the global totals (Tg/yr) of the first field before and after.
+    """
+    source = pp_template.load_template(infile, stash)
+    target = pp_template.load_template(gridfile, stash if grid_stash is None else grid_stash)
+    weights = cached_weights(cachedir, source.lats, source.lons, target.lats, target.lons)
+    ints, _, _, _ = pp_template.read_lookups(infile)
+    fields = np.flatnonzero((ints[:, pp_template.LBUSER4] == stash) & (ints[:, pp_template.LBUSER7] == 1))
+    data = np.array([pp_template.load_field(infile, i) for i in fields], dtype='f8')
+    out = regrid(weights, data)
+
+    before = rate_solver.total_tgyr(data[0], pp_template.area_weights(source.lats, source.lons))
+    after = rate_solver.total_tgyr(out[0], pp_template.area_weights(target.lats, target.lons))
+    rate_solver.check_total(after, before)
+    pp_template.save_pp(target_template(source, target), out, opfile, stash)
+    return before, after
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Conservatively regrid an MCB emissions pp-file.')
+    parser.add_argument('infile', help='emissions pp-file (unpacked, e.g. from bdd_ancil.py)')
+    parser.add_argument('gridfile', help='pp-file on the target grid')
+    parser.add_argument('opfile', help='output pp-file')
+    parser.add_argument('--stash', type=int, default=301, help='section-0 STASH item of the emissions')
+    parser.add_argument('--grid-stash', type=int, help='STASH item to take the target grid from')
+    parser.add_argument('--cachedir', help='cache the regridding weights here between runs')
+    args = parser.parse_args(argv)
+
+    before, after = regrid_pp(args.infile, args.gridfile, args.opfile, args.stash,
+                              args.grid_stash, args.cachedir)
+    print('{}: total (Tg[sea-salt]/yr) = {:.4f} before, {:.4f} after'
+          .format(args.opfile, before, after))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+# Time-varying emissions: seasonal cycles and multi-year ramps.
+#
+# A schedule is a (ntimes, nregions) array of factors applied to each
+# region's annual target (Tg/yr) at each output time. The emission field
+# at time t is then one rate solve (see rate_solver.py) with targets
+# scaled by factors[t], so the spatial pattern is worked out once and the
+# time variation is just broadcasting.
+#
+# Seasonal profiles (12 monthly values, Jan-Dec) are rescaled to average
+# 1 over the year, so each year still adds up to its annual target; all
+# months are 30 days in the 360-day model calendar. A ramp scales the
+# annual target linearly from year to year.
+#
+# Fields are produced one time at a time (monthly_fields), or as a lazy
+# dask array with one chunk per time (lazy_fields), so iris.save writes
+# a run of any length month by month without holding it all in memory.
+
+import numpy as np
+
+import rate_solver
+
+
+def seasonal_factors(profile):
+    """Monthly factors (Jan-Dec) rescaled to average 1 over the year.
+
+    profile has shape (12,) for all regions or (nregions, 12).
+    """
+    profile = np.asarray(profile, dtype='f8')
+    if profile.shape[-1] != 12:
+        raise ValueError('a seasonal profile needs 12 monthly values, not {}'
+                         .format(profile.shape[-1]))
+    mean = profile.mean(axis=-1, keepdims=True)
+    if np.any(mean <= 0):
+        raise ValueError('seasonal profile must have a positive mean')
+    return profile / mean
+
+
+def ramp_factors(nyears, start=1.0, end=1.0):
+    """Factors going linearly from start (first year) to end (last year)."""
+    if nyears == 1:
+        return np.array([float(start)])
+    return np.linspace(start, end, nyears)
+
+
+def time_factors(months, nregions=1, seasonal=None, ramp=None):
+    """(ntimes, nregions) factors for output times in the given months.
+
+    months are the calendar months (1-12) of each output time; each run
+    of 12 times counts as one year for the ramp. ramp is (start, end).
+    """
+    months = np.asarray(months)
+    factors = np.ones((len(months), nregions))
+    if seasonal is not None:
+        season = np.broadcast_to(seasonal_factors(seasonal), (nregions, 12))
+        factors *= season[:, months - 1].T
+    if ramp is not None:
+        year = np.arange(len(months)) // 12
+        factors *= ramp_factors(year[-1] + 1, *ramp)[year, np.newaxis]
+    return factors
+
+
+def monthly_fields(solver, targets, factors):
+    """Yield the 2-D emission field (kg m-2 s-1) for each time in turn."""
+    targets = np.asarray(targets, dtype='f8')
+    for f in factors:
+        yield rate_solver.solve(solver, targets * f)
+
+
+def lazy_fields(solver, targets, factors, dtype='f4'):
+    """Lazy (time, lat, lon) dask array of the scheduled emission fields."""
+    # dask comes with iris, so only needed here rather than at the top.
+    import dask.array as da
+    targets = np.asarray(targets, dtype='f8')
+    nlat, nlon = solver.shape
+
+    def block(f):
+        return rate_solver.solve(solver, targets * f).astype(dtype)
+
+    factors = da.from_array(np.asarray(factors, dtype='f8'), chunks=(1, len(targets)))
+    return factors.map_blocks(block, drop_axis=1, new_axis=[1, 2], dtype=dtype,
+                              chunks=((1,) * factors.shape[0], (nlat,), (nlon,)))
+
+
+def cube_months(cube):
+    """Calendar month (1-12) of each time of a cube."""
+    time = cube.coord('time')
+    return np.array([d.month for d in time.units.num2date(time.points)])
+
+
+def extend_cube(template, nyears):
+    """Template cube repeated for nyears successive years.
+
+    The forecast coordinates are dropped, as they don't apply to the
+    repeated years (and aren't needed for an ancillary). The data stays
+    lazy.
+    """
+    # iris is only needed for this, not for the schedules themselves.
+    import iris.cube
+    cubes = iris.cube.CubeList()
+    for year in range(nyears):
+        cube = template.copy()
+        for name in ('forecast_period', 'forecast_reference_time'):
+            if cube.coords(name):
+                cube.remove_coord(name)
+        time = cube.coord('time')
+
+        def shift(t):
+            dates = time.units.num2date(np.ravel(t))
+            return time.units.date2num([d.replace(year=d.year + year) for d in dates]).reshape(np.shape(t))
+
+        time.points = shift(time.points)
+        if time.has_bounds():
+            time.bounds = shift(time.bounds)
+        cubes.append(cube)
+    return cubes.concatenate_cube()
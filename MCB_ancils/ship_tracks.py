@@ -0,0 +1,182 @@
+# Emissions from spray-vessel deployments (ship tracks or fixed point
+# sources) instead of a uniform flux over lat/lon boxes.
+#
+# => python3 ship_tracks.py tracks.csv ships_MCB.pp
+# => python3 ship_tracks.py tracks.parquet ships_MCB.anc --interval 600
+#
+# The track file has one row per position sample:
+#
+#    time,lat,lon,rate
+#    2040-01-01T00:00,-20.5,275.25,12.0
+#    2040-01-01T01:00,-20.6,275.40,12.0
+#
+# "time" is an ISO date/time, "lat"/"lon" in degrees (any longitude
+# convention) and "rate" the sea-salt spray rate in kg/s. Each sample
+# stands for the spraying over the following --interval seconds (3600 by
+# default), or over its own "duration" column (s) if the file has one.
+# Parquet files need pyarrow ("pip install pyarrow").
+#
+# The file is read --chunksize rows at a time, so memory use doesn't grow
+# with the number of track points. Each chunk is gridded with whole-array
+# operations: the latitude and longitude cells come from np.searchsorted
+# on the template's cell edges, and the mass (rate x duration) is added
+# to a (month, lat, lon) accumulator with one np.bincount. Samples are
+# binned by calendar month; a deployment spanning several years gives the
+# mean annual cycle, each calendar month being averaged over the years it
+# was sampled in (so a deployment from July to the next June counts as
+# one year, not two). Each month's mass is then spread over its gridbox
+# area and a 30-day model month to give the flux (kg m-2 s-1) for the
+# template field of that month.
+
+import argparse
+import csv
+import itertools
+
+import numpy as np
+
+import mcb_ancil
+import pp_template
+from rate_solver import SECS_PER_YEAR
+
+
+COLUMNS = ('time', 'lat', 'lon', 'rate')
+
+
+def _chunk_arrays(columns, interval):
+    # (time, lat, lon, mass) arrays from a chunk's columns.
+    time = np.asarray(columns['time'], dtype='datetime64[s]')
+    rate = np.asarray(columns['rate'], dtype='f8')
+    duration = columns.get('duration')
+    duration = interval if duration is None else np.asarray(duration, dtype='f8')
+    return (time, np.asarray(columns['lat'], dtype='f8'), np.asarray(columns['lon'], dtype='f8'),
+            rate * duration)
+
+
+def _csv_chunks(path, chunksize):
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        header = [name.strip() for name in next(reader)]
+        while True:
+            rows = list(itertools.islice(reader, chunksize))
+            if not rows:
+                return
+            yield dict(zip(header, zip(*rows)))
+
+
+def _parquet_chunks(path, chunksize):
+    try:
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError('reading {} needs pyarrow ("pip install pyarrow")'.format(path))
+    table = pyarrow.parquet.ParquetFile(path)
+    columns = [name for name in table.schema_arrow.names if name in COLUMNS + ('duration',)]
+    for batch in table.iter_batches(batch_size=chunksize, columns=columns):
+        yield {name: batch.column(name).to_numpy(zero_copy_only=False) for name in columns}
+
+
+def read_tracks(path, chunksize=1000000, interval=3600.):
+    """Yield (time, lat, lon, mass) arrays for each chunk of a track file.
+
+    mass (kg) is the rate times the sample's duration (see top of file).
+    """
+    chunks = _parquet_chunks if path.endswith(('.parquet', '.pq')) else _csv_chunks
+    for columns in chunks(path, chunksize):
+        missing = [name for name in COLUMNS if name not in columns]
+        if missing:
+            raise ValueError('{}: no {} column'.format(path, ', '.join(missing)))
+        yield _chunk_arrays(columns, interval)
+
+
+def cell_indices(lats, lons, lat, lon):
+    """Flat (lat, lon) gridbox index of each point, or -1 if off the grid.
+
+    The cells are those of iris guess_bounds() (see pp_template._bounds);
+    longitudes wrap round.
+    """
+    lat_edges = pp_template._bounds(np.asarray(lats, dtype='f8'))
+    lon_edges = pp_template._bounds(np.asarray(lons, dtype='f8'))
+    i = np.searchsorted(lat_edges, lat, side='right') - 1
+    # The first cell's western edge is the start of the longitude range:
+    lon = lon_edges[0] + np.mod(lon - lon_edges[0], 360.)
+    j = np.searchsorted(lon_edges, lon, side='right') - 1
+    inside = (i >= 0) & (i < len(lats)) & (j >= 0) & (j < len(lons))
+    return np.where(inside, i * len(lons) + j, -1)
+
+
+def grid_tracks(chunks, lats, lons):
+    """Accumulate track chunks into monthly mass on a grid.
+
+    Returns (mass, sampled, dropped): the (12, lat, lon) mass (kg) for
+    each calendar month, the months (datetime64[M], sorted) the samples
+    fall in, and the mass of samples off the grid.
+    """
+    ncells = len(lats) * len(lons)
+    mass = np.zeros(12 * ncells)
+    sampled = set()
+    dropped = 0.0
+    for time, lat, lon, chunk_mass in chunks:
+        months = time.astype('datetime64[M]').astype('i8')
+        sampled.update(np.unique(months).tolist())
+        cells = cell_indices(lats, lons, lat, lon)
+        off = cells < 0
+        dropped += chunk_mass[off].sum()
+        keys = (months[~off] % 12) * ncells + cells[~off]
+        mass += np.bincount(keys, weights=chunk_mass[~off], minlength=mass.size)
+    sampled = np.array(sorted(sampled), dtype='i8').astype('datetime64[M]')
+    return mass.reshape(12, len(lats), len(lons)), sampled, dropped
+
+
+def month_years(sampled):
+    """Number of years each calendar month was sampled in (from grid_tracks), shape (12,)."""
+    return np.bincount(sampled.astype('i8') % 12, minlength=12)
+
+
+def monthly_flux(mass, grid_areas, nyears=1):
+    """Flux (kg m-2 s-1) for each month from its mass (kg), per model month.
+
+    nyears is the number of years the mass is summed over, one for all
+    months or one per month (see month_years).
+    """
+    return annual_mass(mass, nyears) / (SECS_PER_YEAR / 12.) / grid_areas
+
+
+def annual_mass(mass, nyears=1):
+    """Mean mass (kg) in each month of a year, dividing by its nyears (months with none stay 0)."""
+    nyears = np.maximum(np.asarray(nyears, dtype='f8'), 1.0)
+    return mass / nyears.reshape(nyears.shape + (1,) * (mass.ndim - nyears.ndim))
+
+
+def template_fields(template, flux):
+    """Monthly fluxes in the order of the template's fields (by their month)."""
+    return flux[template.ints[:, pp_template.LBMON] - 1]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build an MCB emission ancillary from ship tracks.')
+    parser.add_argument('trackfile', help='CSV (or Parquet) file of time, lat, lon and rate (kg/s)')
+    parser.add_argument('opfile', help='output file (.pp, or .anc for a UM ancillary)')
+    parser.add_argument('--interval', type=float, default=3600.,
+                        help='seconds of spraying per sample, without a duration column')
+    parser.add_argument('--chunksize', type=int, default=1000000, help='rows read at a time')
+    parser.add_argument('--infile', default=mcb_ancil.INFILE, help='template pp-file')
+    parser.add_argument('--landfile', default=mcb_ancil.LANDFILE, help='land-fraction pp-file')
+    parser.add_argument('--cachedir', help='cache grid areas here between runs')
+    args = parser.parse_args(argv)
+
+    grid = mcb_ancil.load_grid(args.infile, args.landfile, args.cachedir)
+    chunks = read_tracks(args.trackfile, args.chunksize, args.interval)
+    mass, sampled, dropped = grid_tracks(chunks, grid.lats, grid.lons)
+    if not len(sampled):
+        parser.error('{} has no track points'.format(args.trackfile))
+    if dropped:
+        print('{}: {:.4g} kg of spray off the grid'.format(args.trackfile, dropped))
+    nyears = month_years(sampled)
+    flux = monthly_flux(mass, grid.grid_areas, nyears)
+    annual = np.sum(annual_mass(mass, nyears), axis=0)
+    mcb_ancil.write_ancil(grid, template_fields(grid.template, flux), args.opfile)
+    print('{}: {} to {}, total (Tg[sea-salt]/yr) = {:.4f}, {:.4f} of it at land or coast points'
+          .format(args.opfile, sampled[0], sampled[-1], annual.sum() * 1e-9, annual[~grid.ocean].sum() * 1e-9))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+# Compare a newly generated emissions file with a reference one, e.g.
+# after changing the scripts or at the end of a batch run.
+#
+# => python3 validate.py new.pp NO_50Tg_MCB.pp
+# => python3 validate.py new.pp NO_50Tg_MCB.pp --regions 16 --rtol 1e-6
+#
+# The two files are read one month at a time (pp-files memory-mapped,
+# see pp_template.iter_fields; .nc files through netCDF4 if installed),
+# so memory use doesn't grow with the length of the run. For each month
+# the global and per-region totals (Tg/yr) of both files, the largest
+# absolute and relative differences and the number of points that
+# differ by more than the tolerances (as np.isclose) are worked out with
+# whole-array operations, and the per-region totals with one matrix
+# product over the region masks.
+#
+# The command exits with status 1 if the files don't match: either file
+# missing, different numbers of fields, dates or grids, any points
+# outside the tolerances, or totals differing by more than --total-rtol.
+
+import argparse
+import collections
+import itertools
+import os
+import sys
+
+import numpy as np
+
+import mcb_ancil
+import pp_template
+import rate_solver
+import region_config
+
+
+Month = collections.namedtuple('Month', ['date', 'total', 'ref_total', 'max_abs', 'max_rel',
+                                         'changed', 'region_totals', 'ref_region_totals'])
+
+
+def _pp_months(path):
+    # (date, lats, lons, data) for each field of a pp-file.
+    for ints, reals, data in pp_template.iter_fields(path):
+        lats, lons = pp_template.grid_points(ints, reals)
+        data = np.where(data == reals[pp_template.BMDI], np.nan, data)
+        yield '{:04d}-{:02d}-{:02d}'.format(*ints[:3]), lats, lons, data
+
+
+def _nc_months(path):
+    # Same for the first (time, lat, lon) variable of a netCDF file.
+    try:
+        import netCDF4
+    except ImportError:
+        raise ImportError('comparing netCDF files needs netCDF4 ("pip install netCDF4")')
+    with netCDF4.Dataset(path) as nc:
+        var = next(v for v in nc.variables.values() if v.ndim == 3)
+        time, lat, lon = (nc.variables[d] for d in var.dimensions)
+        dates = netCDF4.num2date(time[:], time.units, getattr(time, 'calendar', 'standard'))
+        for t, date in enumerate(dates):
+            data = np.ma.filled(var[t].astype('f8'), np.nan)
+            yield date.strftime('%Y-%m-%d'), lat[:], lon[:], data
+
+
+def months(path):
+    """Yield (date, lats, lons, data) for each month of a .pp or .nc file."""
+    return _nc_months(path) if path.endswith('.nc') else _pp_months(path)
+
+
+def compare_month(new, ref, grid_areas, masks=None, rtol=1e-5, atol=0.0):
+    """Month of statistics comparing two (lat, lon) fields."""
+    new = np.asarray(new, dtype='f8')
+    ref = np.asarray(ref, dtype='f8')
+    diff = np.abs(new - ref)
+    both_missing = np.isnan(new) & np.isnan(ref)
+    diff = np.where(both_missing, 0.0, diff)
+    changed = ~both_missing & ~(diff <= atol + rtol * np.abs(ref))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rel = np.where(ref != 0, diff / np.abs(ref), np.where(diff > 0, np.inf, 0.0))
+
+    # Missing points emit nothing:
+    new = np.nan_to_num(new) * grid_areas
+    ref = np.nan_to_num(ref) * grid_areas
+    scale = rate_solver.SECS_PER_YEAR * 1e-9
+    if masks is None:
+        region_totals = ref_region_totals = np.zeros(0)
+    else:
+        flat = masks.reshape(len(masks), -1)
+        region_totals = flat @ new.ravel() * scale
+        ref_region_totals = flat @ ref.ravel() * scale
+    return Month(None, new.sum() * scale, ref.sum() * scale, np.nanmax(diff), np.nanmax(rel),
+                 int(changed.sum()), region_totals, ref_region_totals)
+
+
+def validate(newfile, reffile, regions=None, rtol=1e-5, atol=0.0, total_rtol=1e-5):
+    """Compare two files month by month.
+
+    regions is a list of region numbers, boxes or Regions (see
+    mcb_ancil.build_regions) to total separately. Returns (ok, months,
+    problems), problems being a list of messages; a missing file is one
+    of them.
+    """
+    missing = [path for path in (newfile, reffile) if not os.path.exists(os.path.expanduser(path))]
+    if missing:
+        return False, [], ['{}: no such file'.format(path) for path in missing]
+    stats, problems = [], []
+    grid_areas = masks = None
+    for new_month, ref_month in itertools.zip_longest(months(newfile), months(reffile)):
+        if new_month is None or ref_month is None:
+            problems.append('{} has more months than {}'.format(
+                *((reffile, newfile) if new_month is None else (newfile, reffile))))
+            break
+        date, lats, lons, new = new_month
+        ref_date, ref_lats, ref_lons, ref = ref_month
+        if date != ref_date:
+            problems.append('month {}: date {} != reference {}'.format(len(stats) + 1, date, ref_date))
+        if new.shape != ref.shape or not (np.allclose(lats, ref_lats) and np.allclose(lons, ref_lons)):
+            problems.append('{}: grids differ ({} vs {})'.format(date, new.shape, ref.shape))
+            break
+        if grid_areas is None:
+            grid_areas = pp_template.area_weights(lats, lons)
+            if regions:
+                masks = np.array([region_config.region_mask_of(lats, lons, r)
+                                  for r in mcb_ancil.resolve_regions(regions)])
+        month = compare_month(new, ref, grid_areas, masks, rtol, atol)._replace(date=date)
+        stats.append(month)
+        if month.changed:
+            problems.append('{}: {} points differ (max abs {:.3g}, max rel {:.3g})'
+                            .format(date, month.changed, month.max_abs, month.max_rel))
+        totals = np.append(month.total, month.region_totals)
+        ref_totals = np.append(month.ref_total, month.ref_region_totals)
+        if not np.allclose(totals, ref_totals, rtol=total_rtol, atol=0):
+            problems.append('{}: totals (Tg/yr) {} != reference {}'.format(date, totals, ref_totals))
+    return not problems, stats, problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare an emissions file with a reference.')
+    parser.add_argument('newfile', help='generated .pp (or .nc) file')
+    parser.add_argument('reffile', help='reference .pp (or .nc) file')
+    parser.add_argument('--regions', nargs='+', help='regions to total separately (see mcb_ancil.py)')
+    parser.add_argument('--config', help='JSON/YAML/GeoJSON region file')
+    parser.add_argument('--rtol', type=float, default=1e-5, help='relative tolerance per point')
+    parser.add_argument('--atol', type=float, default=0.0, help='absolute tolerance per point (kg m-2 s-1)')
+    parser.add_argument('--total-rtol', type=float, default=1e-5, help='relative tolerance on the totals')
+    parser.add_argument('--quiet', action='store_true', help='only print problems')
+    args = parser.parse_args(argv)
+
+    regions = None
+    if args.regions or args.config:
+        regions = mcb_ancil.select_regions(args.regions, args.config)
+    ok, stats, problems = validate(args.newfile, args.reffile, regions, args.rtol, args.atol,
+                                   args.total_rtol)
+    if not args.quiet:
+        print('{:<12} {:>12} {:>12} {:>10} {:>10} {:>8}'
+              .format('month', 'Tg/yr', 'ref Tg/yr', 'max abs', 'max rel', 'changed'))
+        for m in stats:
+            print('{:<12} {:>12.6f} {:>12.6f} {:>10.3g} {:>10.3g} {:>8d}'
+                  .format(m.date, m.total, m.ref_total, m.max_abs, m.max_rel, m.changed))
+            for k, (total, ref_total) in enumerate(zip(m.region_totals, m.ref_region_totals)):
+                print('{:<12} {:>12.6f} {:>12.6f}'.format('  region {}'.format(k + 1), total, ref_total))
+    for problem in problems:
+        print(problem)
+    print('{}: {}'.format(args.newfile, 'matches' if ok else 'DOES NOT MATCH'))
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
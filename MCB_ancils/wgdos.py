@@ -0,0 +1,138 @@
+# WGDOS packing (lbpack=1) of pp-file fields, as the UM and iris/mule
+# write them, to cut the size of the output pp-files.
+#
+# A packed field is three header words (length, accuracy, columns and
+# rows) and then each row in turn: a base value (the row minimum, as an
+# IBM 32-bit float), a word giving the bits per value and the row's
+# length, and the row's values as unsigned integers of that many bits,
+# (value - base) / 2**accuracy rounded. A row where every value is the
+# same (e.g. all zero, outside the regions) takes no bits at all, so the
+# mostly-zero emission fields pack to a fraction of their unpacked size.
+# (Repacking the template's fields at their own accuracy gives back the
+# template's packed data exactly.)
+# Rows are packed in groups with the same number of bits, each group
+# with one np.packbits call.
+#
+# The accuracy is chosen per field to keep "bits" significant bits of
+# its largest value (see accuracy()); every value is then within
+# 2**(accuracy - 1) of the original (at most 2**-bits times twice the
+# largest value), and exact zeros stay zero. That's exact for a field
+# whose non-zero values are all the same (one uniform flux, as in
+# NO_50Tg_MCB.pp), but not for values much smaller than the largest,
+# e.g. regions with lower rates or points weighted by ocean fraction,
+# whose 32-bit values keep only the bits above 2**accuracy.
+
+import numpy as np
+
+
+LBPACK_WGDOS = 1
+
+# IBM hexadecimal floats: 7-bit base-16 exponent (excess 64), 24-bit fraction.
+_IBM_BIAS = 64
+_IBM_FRAC = 2.0**24
+
+
+def ibm_floor(values):
+    """Largest IBM 32-bit floats <= values, as (words, values)."""
+    values = np.asarray(values, dtype='f8')
+    sign = values < 0
+    mag = np.abs(values)
+    with np.errstate(divide='ignore'):
+        exp = np.floor(np.log(np.where(mag > 0, mag, 1.0)) / np.log(16.)).astype('i8') + 1
+    # Correct any rounding in the log so mag / 16**exp is in [1/16, 1):
+    exp += mag >= 16.0**exp
+    exp -= mag < 16.0**(exp - 1)
+    # Round the magnitude down for positive values, up for negative ones:
+    frac = np.where(sign, np.ceil(mag / 16.0**exp * _IBM_FRAC), np.floor(mag / 16.0**exp * _IBM_FRAC))
+    carry = frac >= _IBM_FRAC
+    frac = np.where(carry, frac / 16., frac)
+    exp = exp + carry
+    zero = mag == 0
+    words = ((sign.astype('u8') << 31) | ((exp + _IBM_BIAS).astype('u8') << 24) | frac.astype('u8'))
+    words = np.where(zero, 0, words).astype('u4')
+    return words, np.where(zero, 0.0, np.where(sign, -1.0, 1.0) * frac / _IBM_FRAC * 16.0**exp)
+
+
+def ibm_values(words):
+    """Values of IBM 32-bit floats."""
+    words = np.asarray(words, dtype='u4').astype('i8')
+    frac = (words & 0xffffff) / _IBM_FRAC
+    exp = ((words >> 24) & 0x7f) - _IBM_BIAS
+    return np.where(words >> 31, -1.0, 1.0) * frac * 16.0**exp
+
+
+def accuracy(data, bits=24):
+    """Accuracy (power of 2) keeping bits significant bits of the largest value."""
+    top = np.max(np.abs(data))
+    if top == 0:
+        return 0
+    return int(np.floor(np.log2(top))) + 1 - bits
+
+
+def pack(data, acc):
+    """WGDOS-pack a (lat, lon) field at accuracy acc, as big-endian 32-bit words."""
+    data = np.asarray(data, dtype='f8')
+    if not np.all(np.isfinite(data)):
+        raise ValueError('WGDOS packing of missing or non-finite data is not supported')
+    nrows, ncols = data.shape
+    scale = 2.0**acc
+    base_words, bases = ibm_floor(data.min(axis=1))
+    values = np.rint((data - bases[:, np.newaxis]) / scale).astype('i8')
+    top = values.max(axis=1)
+    nbits = np.zeros(nrows, dtype='i8')
+    nbits[top > 0] = np.floor(np.log2(top[top > 0])).astype('i8') + 1
+    if nbits.max() > 31:
+        raise ValueError('WGDOS accuracy 2**{} is too fine for values up to {:g}'.format(acc, data.max()))
+
+    # Packed rows, grouped by their number of bits:
+    nwords = (ncols * nbits + 31) // 32
+    rows = [None] * nrows
+    for b in np.unique(nbits):
+        which = np.flatnonzero(nbits == b)
+        if b == 0:
+            for r in which:
+                rows[r] = np.zeros(0, dtype='>u4')
+            continue
+        shifts = np.arange(b - 1, -1, -1)
+        bits = ((values[which, :, np.newaxis] >> shifts) & 1).astype('u1').reshape(len(which), -1)
+        padded = np.zeros((len(which), nwords[which[0]] * 32), dtype='u1')
+        padded[:, :bits.shape[1]] = bits
+        packed = np.packbits(padded, axis=1).view('>u4')
+        for k, r in enumerate(which):
+            rows[r] = packed[k]
+
+    out = [np.array([0, np.int32(acc).view('u4'), (ncols << 16) | nrows], dtype='>u4')]
+    for r in range(nrows):
+        out.append(np.array([base_words[r], (nbits[r] << 16) | nwords[r]], dtype='>u4'))
+        out.append(rows[r])
+    words = np.concatenate(out)
+    words[0] = len(words)
+    # Padded to a whole number of 64-bit words, as the UM writes them:
+    return np.append(words, np.zeros(len(words) % 2, dtype='>u4')).astype('>u4')
+
+
+def unpack(words):
+    """(lat, lon) field from WGDOS-packed 32-bit words (e.g. a pp data record).
+
+    Rows with missing-data, minimum or zero bitmaps (which the UM may
+    write, though pack() doesn't) aren't handled.
+    """
+    words = np.asarray(words, dtype='>u4')
+    acc = int(words[1].astype('u4').view('i4'))
+    ncols, nrows = int(words[2] >> 16), int(words[2] & 0xffff)
+    data = np.empty((nrows, ncols))
+    pos = 3
+    for r in range(nrows):
+        base = ibm_values(words[pos])
+        flags, nwords = int(words[pos + 1] >> 16), int(words[pos + 1] & 0xffff)
+        if flags & ~0x1f:
+            raise ValueError('WGDOS row {} has bitmaps (flags {:#x}), which are not handled'.format(r, flags))
+        nbits = flags & 0x1f
+        if nbits:
+            bits = np.unpackbits(words[pos + 2:pos + 2 + nwords].view('u1'))[:ncols * nbits]
+            values = bits.reshape(ncols, nbits).astype('i8') @ (1 << np.arange(nbits - 1, -1, -1))
+            data[r] = base + values * 2.0**acc
+        else:
+            data[r] = base
+        pos += 2 + nwords
+    return data
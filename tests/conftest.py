@@ -0,0 +1,17 @@
+# The MCB_ancils scripts import each other as top-level modules and find
+# the template and land-fraction files relative to their own directory.
+
+import os
+import sys
+
+import pytest
+
+ANCILS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'MCB_ancils')
+sys.path.insert(0, ANCILS)
+
+
+@pytest.fixture
+def ancils(monkeypatch):
+    """Run the test from the MCB_ancils directory (for the template files)."""
+    monkeypatch.chdir(ANCILS)
+    return ANCILS
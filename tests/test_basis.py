@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+import basis
+import mcb_ancil
+
+
+def test_basis_round_trip(ancils, tmp_path):
+    grid = mcb_ancil.load_grid()
+    made = basis.make_basis(grid, ['2', '16'])
+    path = str(tmp_path / 'basis.npz')
+    basis.save_basis(made, path)
+    loaded = basis.load_basis(path)
+    assert loaded.metadata == made.metadata
+    basis.check_basis(loaded, grid)
+    field = basis.scenario_field(loaded, [20.0, 30.0])
+    assert np.isclose(mcb_ancil.total_tgyr(grid, field), 50.0)
+    np.testing.assert_array_equal(field, mcb_ancil.compute_field(mcb_ancil.build_regions(grid, [2, 16]),
+                                                                 [20.0, 30.0]))
+
+
+def test_stale_basis(ancils):
+    grid = mcb_ancil.load_grid()
+    made = basis.make_basis(grid, ['2'])
+    edited = made._replace(metadata=dict(made.metadata, regions=['region_250_-30_290_10']))
+    with pytest.raises(ValueError, match='region definitions'):
+        basis.check_basis(edited, grid)
+    with pytest.raises(ValueError, match='grid'):
+        basis.check_basis(made, grid, mcb_ancil.INFILE)
@@ -0,0 +1,28 @@
+import numpy as np
+
+import benchmark
+import mcb_ancil
+import pp_template
+
+# Lookup words iris needs to read a field:
+LBCODE = 15
+LBREL = 21
+
+
+def test_synthetic_template_keeps_real_headers(ancils, tmp_path):
+    real = pp_template.load_template(mcb_ancil.INFILE)
+    template = benchmark.synthetic_template(96)
+    # N96 is the template's own grid, so only the packing differs:
+    unpacked = [pp_template.LBPACK, pp_template.LBLREC]
+    np.testing.assert_array_equal(np.delete(template.ints, unpacked, axis=1),
+                                  np.delete(real.ints, unpacked, axis=1))
+    np.testing.assert_array_equal(template.reals, real.reals)
+    np.testing.assert_allclose(template.lats, real.lats)
+
+    template = benchmark.synthetic_template(216)
+    assert template.ints[0, LBREL] == real.ints[0, LBREL] != 0
+    path = str(tmp_path / 'template.pp')
+    pp_template.save_pp(template, np.zeros(benchmark.grid_shape(216), dtype='f4'), path, stash=24)
+    written = pp_template.load_template(path)
+    assert written.lats.shape == (324,) and written.lons.shape == (432,)
+    assert written.ints[0, LBCODE] == real.ints[0, LBCODE]
@@ -0,0 +1,41 @@
+import numpy as np
+
+import grid_cache
+import region_config
+
+LATS = np.arange(-88.75, 90., 2.5)
+LONS = np.arange(1.25, 360., 2.5)
+
+
+def test_box_names_keep_every_digit():
+    a = grid_cache.box_name([123.4567, -10, 150, 10])
+    b = grid_cache.box_name([123.4571, -10, 150, 10])
+    assert a != b
+    assert grid_cache.box_name([0, 50, 360, 80]) == 'region_0_50_360_80'
+    assert region_config.cache_name([123.4567, -10, 150, 10]) == a
+
+
+def test_key_changes_with_grid_and_land(tmp_path):
+    land = tmp_path / 'land.pp'
+    land.write_bytes(b'land fraction')
+    key = grid_cache.grid_key([LATS, LONS], str(land))
+    assert grid_cache.grid_key([LATS, LONS], str(land)) == key
+    assert grid_cache.grid_key([LATS + 0.1, LONS], str(land)) != key
+    assert grid_cache.grid_key([LATS, LONS[:-1]], str(land)) != key
+    assert grid_cache.grid_key([LATS, LONS]) != key
+    land.write_bytes(b'land fraction, edited')
+    assert grid_cache.grid_key([LATS, LONS], str(land)) != key
+
+
+def test_cached_array(tmp_path):
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return np.arange(5.)
+
+    path = grid_cache.cache_path(str(tmp_path), [LATS, LONS])
+    for _ in range(2):
+        np.testing.assert_array_equal(grid_cache.cached_array(path, 'x', compute), np.arange(5.))
+    assert len(calls) == 1
+    assert sorted(p.name for p in tmp_path.iterdir()) == [grid_cache.grid_key([LATS, LONS])]
@@ -0,0 +1,22 @@
+import os
+
+import numpy as np
+
+import incremental
+import rate_solver
+import region_index
+
+
+def test_update_field(tmp_path):
+    masks = np.random.default_rng(6).random((3, 6, 8)) > 0.4
+    solver = rate_solver.make_solver(region_index.build_index(masks, 'sum'), np.ones((6, 8)))
+    field, changed = incremental.update_field(solver, [1.0, 2.0, 3.0], str(tmp_path))
+    assert list(changed) == [0, 1, 2]
+    assert os.listdir(str(tmp_path)) == [incremental.STATE]
+
+    field, changed = incremental.update_field(solver, [1.0, 5.0, 3.0], str(tmp_path))
+    assert list(changed) == [1]
+    np.testing.assert_allclose(field, rate_solver.solve(solver, [1.0, 5.0, 3.0]))
+    saved, coefficients = incremental.load_state(str(tmp_path))
+    np.testing.assert_array_equal(saved, field)
+    np.testing.assert_array_equal(coefficients, rate_solver.region_coefficients(solver, [1.0, 5.0, 3.0]))
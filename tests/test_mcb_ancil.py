@@ -0,0 +1,32 @@
+import json
+
+import pytest
+
+import mcb_ancil
+
+
+def test_load_fields(tmp_path):
+    path = tmp_path / 'fields.json'
+    path.write_text(json.dumps({'fields': [
+        {'stash': 301, 'name': 'Sea-salt emissions'},
+        {'stash': 302, 'name': 'Sea-salt number emissions', 'units': 'm-2 s-1', 'scale': 1.2e16}]}))
+    specs = mcb_ancil.load_fields(str(path))
+    assert specs[0] == mcb_ancil.SEA_SALT
+    assert specs[1] == mcb_ancil.FieldSpec(302, 'Sea-salt number emissions', 'm-2 s-1', 1.2e16)
+
+
+def test_repeated_stash(tmp_path):
+    path = tmp_path / 'fields.json'
+    path.write_text(json.dumps({'fields': [{'stash': 301, 'name': 'a'}, {'stash': 301, 'name': 'b'}]}))
+    with pytest.raises(ValueError):
+        mcb_ancil.load_fields(str(path))
+
+
+@pytest.mark.parametrize('number', [0, -1, 17])
+def test_bad_region_number(number):
+    with pytest.raises(ValueError, match='R{}'.format(number)):
+        mcb_ancil.resolve_regions([2, number])
+
+
+def test_region_numbers():
+    assert mcb_ancil.resolve_regions([1, 16]) == [mcb_ancil.rs[0], mcb_ancil.rs[15]]
@@ -0,0 +1,77 @@
+import os
+
+import pytest
+
+import output_store
+
+
+@pytest.fixture
+def inputs(tmp_path):
+    path = tmp_path / 'template.pp'
+    path.write_bytes(b'template')
+    return [str(path)]
+
+
+def _writer(calls, content=b'data'):
+    def write(path):
+        calls.append(path)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return {'total': 50.0}
+    return write
+
+
+def test_skip_and_rebuild(tmp_path, inputs):
+    outdir = str(tmp_path / 'out')
+    calls = []
+    definition = {'rsel': [16], 'tgyr': [50.0]}
+    assert output_store.build(outdir, 'a.pp', definition, inputs, _writer(calls)) == ({'total': 50.0}, True)
+    assert os.path.exists(os.path.join(outdir, 'a.pp'))
+    # The same definition again is skipped:
+    assert output_store.build(outdir, 'a.pp', definition, inputs, _writer(calls)) == ({'total': 50.0}, False)
+    assert len(calls) == 1
+    # ...unless skipping is off, the definition or an input changes, or the output is damaged:
+    assert output_store.build(outdir, 'a.pp', definition, inputs, _writer(calls), skip=False)[1]
+    assert output_store.build(outdir, 'a.pp', dict(definition, tgyr=[40.0]), inputs, _writer(calls))[1]
+    with open(inputs[0], 'ab') as f:
+        f.write(b'edited')
+    assert output_store.build(outdir, 'a.pp', dict(definition, tgyr=[40.0]), inputs, _writer(calls))[1]
+    with open(os.path.join(outdir, 'a.pp'), 'ab') as f:
+        f.write(b'!')
+    assert output_store.build(outdir, 'a.pp', dict(definition, tgyr=[40.0]), inputs, _writer(calls))[1]
+    assert len(calls) == 5
+    # Written to temporary names, which are gone afterwards:
+    assert all(os.path.basename(path).startswith('.tmp.') for path in calls)
+    assert sorted(os.listdir(outdir)) == ['a.pp', 'manifest.json', 'manifest.json.lock']
+    assert list(output_store.read_manifest(outdir)) == ['a.pp']
+
+
+def test_failed_write_leaves_nothing(tmp_path, inputs):
+    outdir = str(tmp_path)
+
+    def write(path):
+        with open(path, 'wb') as f:
+            f.write(b'partial')
+        raise RuntimeError('interrupted')
+
+    with pytest.raises(RuntimeError):
+        output_store.build(outdir, 'a.pp', {}, inputs, write)
+    assert sorted(os.listdir(outdir)) == ['template.pp']
+
+
+def test_missing_output_is_not_recorded(tmp_path, inputs):
+    outdir = str(tmp_path / 'out')
+    with pytest.raises(FileNotFoundError):
+        output_store.build(outdir, 'a.anc', {}, inputs, _writer([]))
+    assert output_store.read_manifest(outdir) == {}
+    with pytest.raises(FileNotFoundError):
+        output_store.build(outdir, 'b.pp', {}, inputs, lambda path: {})
+    assert output_store.read_manifest(outdir) == {}
+
+
+def test_code_version_leaves_out_the_user_scripts():
+    assert 'bdd_ancil' not in output_store.LIBRARY
+    assert 'create_ancil' not in output_store.LIBRARY
+    here = os.path.dirname(os.path.abspath(output_store.__file__))
+    assert all(os.path.exists(os.path.join(here, name + '.py')) for name in output_store.LIBRARY)
+    assert len(output_store.code_version()) == 16
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+import mcb_ancil
+import pp_template
+
+
+def test_save_pp_round_trip(ancils, tmp_path):
+    template = pp_template.load_template(mcb_ancil.INFILE)
+    fields = np.arange(12.)[:, None, None] * np.ones(template.lats.shape + template.lons.shape)[None]
+    path = str(tmp_path / 'out.pp')
+    pp_template.save_pp_fields(template, [(301, fields), (302, fields[0])], path)
+    read = list(pp_template.iter_fields(path))
+    assert len(read) == 24
+    assert [ints[pp_template.LBUSER4] for ints, _, _ in read[:4]] == [301, 302, 301, 302]
+    np.testing.assert_array_equal(read[2][2], fields[1])
+    np.testing.assert_array_equal(read[3][2], fields[0])
+
+
+def test_wrong_number_of_fields(ancils, tmp_path):
+    template = pp_template.load_template(mcb_ancil.INFILE)
+    fields = np.zeros((11,) + template.lats.shape + template.lons.shape)
+    with pytest.raises(ValueError):
+        pp_template.save_pp(template, fields, str(tmp_path / 'out.pp'))
+
+
+def test_no_pp_data_under_ancil_names(ancils, tmp_path):
+    template = pp_template.load_template(mcb_ancil.INFILE)
+    for name in ('out.anc', 'out.nc'):
+        with pytest.raises(ValueError):
+            pp_template.save_pp(template, np.zeros(template.lats.shape + template.lons.shape),
+                                str(tmp_path / name))
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+import rate_solver
+import region_index
+
+
+def _index(overlap):
+    masks = np.random.default_rng(3).random((4, 6, 8)) > 0.5
+    masks[3] = False
+    return region_index.build_index(masks, overlap)
+
+
+@pytest.mark.parametrize('overlap', region_index.OVERLAP_POLICIES)
+def test_solve_meets_targets(overlap):
+    areas = np.random.default_rng(4).random((6, 8)) * 1e10
+    weights = np.random.default_rng(5).random((6, 8))
+    solver = rate_solver.make_solver(_index(overlap), areas, weights)
+    targets = np.array([[10.0, 20.0, 5.0, 0.0], [1.0, 0.0, 2.0, 0.0]])
+    fields = rate_solver.solve(solver, targets)
+    assert fields.shape == (2, 6, 8)
+    np.testing.assert_allclose(rate_solver.total_tgyr(fields, areas), targets.sum(axis=1))
+    np.testing.assert_allclose(rate_solver.solve(solver, targets[1]), fields[1])
+
+
+def test_solve_matches_region_field():
+    areas = np.random.default_rng(4).random((6, 8)) * 1e10
+    index = _index('sum')
+    solver = rate_solver.make_solver(index, areas)
+    targets = np.array([10.0, 20.0, 5.0, 0.0])
+    k = rate_solver.region_coefficients(solver, targets)
+    np.testing.assert_allclose(rate_solver.solve(solver, targets), region_index.region_field(index, k))
+
+
+def test_empty_region_target():
+    solver = rate_solver.make_solver(_index('first'), np.ones((6, 8)))
+    with pytest.raises(ValueError):
+        rate_solver.region_coefficients(solver, [1.0, 1.0, 1.0, 1.0])
@@ -0,0 +1,82 @@
+import json
+
+import numpy as np
+import pytest
+
+import pp_template
+import region_config
+import region_mask
+
+LATS = np.arange(-88.75, 90., 2.5)
+LONS = np.arange(1.25, 360., 2.5)
+LONS180 = np.where(LONS > 180, LONS - 360, LONS)
+
+
+def _box_ring(box):
+    w, s, e, n = box
+    return np.array([[w, s], [e, s], [e, n], [w, n]], dtype='f8')
+
+
+@pytest.mark.parametrize('box', [[210, 0, 250, 30], [250, -30, 290, 0], [-25, -30, 15, 0],
+                                 [0, 50, 360, 80], [100, -10, 300, 10], [170, -10, 190, 10]])
+@pytest.mark.parametrize('lons', [LONS, LONS180])
+def test_box_polygon_matches_box_mask(box, lons):
+    w, s, e, n = box
+    expected = region_mask.box_mask(LATS, lons, [w % 360, s, e, n])
+    np.testing.assert_array_equal(region_config.polygon_mask(LATS, lons, [_box_ring(box)]), expected)
+    assert expected.any()
+
+
+def test_wide_bands(ancils):
+    template = pp_template.load_template('cp109a.pm_2040_jan_to_dec_00024.pp')
+    lats, lons = template.lats, template.lons
+    band = region_mask.box_mask(lats, lons, [0, 50, 360, 80])
+    for ring in ([[-180, 50], [180, 50], [180, 80], [-180, 80]],
+                 [[0, 50], [360, 50], [360, 80], [0, 80]]):
+        np.testing.assert_array_equal(region_config.polygon_mask(lats, lons, [ring]), band)
+    wide = region_config.polygon_mask(lats, lons, [[[100, -10], [300, -10], [300, 10], [100, 10]]])
+    np.testing.assert_array_equal(wide, region_mask.box_mask(lats, lons, [100, -10, 300, 10]))
+    assert wide.sum() == 1712
+
+
+def test_date_line():
+    # Running on past 180, from -180, or split in two as GeoJSON files do:
+    expected = region_mask.box_mask(LATS, LONS, [170, -10, 190, 10])
+    for rings in ([_box_ring([170, -10, 190, 10])], [_box_ring([-190, -10, -170, 10])]):
+        np.testing.assert_array_equal(region_config.polygon_mask(LATS, LONS, rings), expected)
+    split = region_config.Region('split', None, [[_box_ring([170, -10, 180, 10])],
+                                                 [_box_ring([-180, -10, -170, 10])]])
+    np.testing.assert_array_equal(region_config.region_mask_of(LATS, LONS, split), expected)
+    # ...whereas 170 to -170 is the long way round:
+    long_way = region_config.polygon_mask(LATS, LONS, [_box_ring([170, -10, -170, 10])])
+    np.testing.assert_array_equal(long_way, region_mask.box_mask(LATS, LONS, [190, -10, 170, 10]))
+
+
+def test_holes():
+    outline = _box_ring([200, -40, 280, 20])
+    hole = _box_ring([220, -20, 240, 0])[::-1]
+    mask = region_config.polygon_mask(LATS, LONS, [outline, hole])
+    np.testing.assert_array_equal(mask, region_mask.box_mask(LATS, LONS, [200, -40, 280, 20]) &
+                                  ~region_mask.box_mask(LATS, LONS, [220, -20, 240, 0]))
+
+
+def test_triangle():
+    # Points either side of the sloping edge from (0.5, 0) to (40.5, 40):
+    mask = region_config.polygon_mask(LATS, LONS, [[[0.5, 0], [40.5, 0], [40.5, 40]]])
+    lat, lon = np.meshgrid(LATS, LONS, indexing='ij')
+    np.testing.assert_array_equal(mask, (lat > 0) & (lon < 40.5) & (lat < lon - 0.5))
+    assert mask.sum() > 100
+
+
+def test_geojson_config(tmp_path):
+    geojson = {'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'properties': {'name': 'band'},
+         'geometry': {'type': 'Polygon', 'coordinates': [[[-180, 50], [180, 50], [180, 80],
+                                                          [-180, 80], [-180, 50]]]}}]}
+    (tmp_path / 'decks.geojson').write_text(json.dumps(geojson))
+    config = {'regions': [{'name': 'NEP', 'box': [210, 0, 250, 30]}, {'geojson': 'decks.geojson'}]}
+    (tmp_path / 'regions.json').write_text(json.dumps(config))
+    regions = region_config.load_regions(str(tmp_path / 'regions.json'))
+    assert [r.name for r in regions] == ['NEP', 'band']
+    np.testing.assert_array_equal(region_config.region_mask_of(LATS, LONS, regions[1]),
+                                  region_mask.box_mask(LATS, LONS, [0, 50, 360, 80]))
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+import region_index
+
+# Two regions on a 1 x 4 grid, sharing the point in column 1:
+MASKS = np.array([[[1, 1, 0, 0]], [[0, 1, 1, 0]]], dtype=bool)
+AREAS = np.array([[1.0, 2.0, 3.0, 4.0]])
+
+
+@pytest.mark.parametrize('overlap, areas', [('first', [3.0, 3.0]),
+                                            ('sum', [3.0, 5.0]),
+                                            ('split', [2.0, 4.0])])
+def test_region_areas(overlap, areas):
+    index = region_index.build_index(MASKS, overlap)
+    np.testing.assert_allclose(region_index.region_areas(index, AREAS), areas)
+
+
+def test_union_area_counts_shared_points_once():
+    for overlap in region_index.OVERLAP_POLICIES:
+        index = region_index.build_index(MASKS, overlap)
+        assert region_index.union_area(index, AREAS) == 6.0
+
+
+@pytest.mark.parametrize('overlap, field', [('first', [[10, 10, 20, 0]]),
+                                            ('sum', [[10, 30, 20, 0]]),
+                                            ('split', [[10, 15, 20, 0]])])
+def test_region_field(overlap, field):
+    index = region_index.build_index(MASKS, overlap)
+    np.testing.assert_allclose(region_index.region_field(index, [10.0, 20.0]), field)
+
+
+@pytest.mark.parametrize('overlap', region_index.OVERLAP_POLICIES)
+def test_region_emissions_add_up_to_field_total(overlap):
+    masks = np.random.default_rng(1).random((5, 6, 8)) > 0.5
+    areas = np.random.default_rng(2).random((6, 8))
+    fluxes = np.arange(1.0, 6.0)
+    index = region_index.build_index(masks, overlap)
+    total = np.sum(region_index.region_field(index, fluxes) * areas)
+    assert np.isclose(total, np.sum(fluxes * region_index.region_areas(index, areas)))
+
+
+def test_counts_and_labels():
+    index = region_index.build_index(MASKS)
+    np.testing.assert_array_equal(region_index.counts(index), [[1, 2, 1, 0]])
+    np.testing.assert_array_equal(region_index.labels(index), [[0, 0, 1, -1]])
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        region_index.build_index(MASKS, 'max')
+
+
+@pytest.mark.parametrize('overlap', region_index.OVERLAP_POLICIES)
+def test_index_points_matches_build_index(overlap):
+    masks = np.random.default_rng(3).random((5, 6, 8)) > 0.5
+    from_masks = region_index.build_index(masks, overlap)
+    from_points = region_index.index_points((6, 8), [np.flatnonzero(m) for m in masks], overlap)
+    for name in region_index.RegionIndex._fields:
+        np.testing.assert_array_equal(getattr(from_points, name), getattr(from_masks, name))
+
+
+def test_index_points_with_empty_regions():
+    index = region_index.index_points((1, 4), [[], [1, 2], []])
+    assert index.nregions == 3
+    np.testing.assert_array_equal(region_index.labels(index), [[-1, 1, 1, -1]])
+    np.testing.assert_array_equal(region_index.region_areas(index, AREAS), [0.0, 5.0, 0.0])
@@ -0,0 +1,89 @@
+import numpy as np
+
+import region_mask
+
+LATS = np.arange(-88.75, 90., 2.5)
+LONS = np.arange(1.25, 360., 2.5)
+
+
+def test_box_mask_selects_points_inside():
+    mask = region_mask.box_mask(LATS, LONS, [250, -30, 290, 0])
+    lat_in = (LATS > -30) & (LATS < 0)
+    lon_in = (LONS > 250) & (LONS < 290)
+    np.testing.assert_array_equal(mask, lat_in[:, None] & lon_in[None, :])
+
+
+def test_box_across_greenwich():
+    across = region_mask.box_mask(LATS, LONS, [335, -30, 15, 0])
+    west = region_mask.box_mask(LATS, LONS, [335, -30, 360, 0])
+    east = region_mask.box_mask(LATS, LONS, [0, -30, 15, 0])
+    np.testing.assert_array_equal(across, west | east)
+    assert across.any()
+
+
+def test_longitude_convention_does_not_matter():
+    lons180 = np.where(LONS > 180, LONS - 360, LONS)
+    for box in ([335, -30, 15, 0], [250, -30, 290, 0], [0, 50, 360, 80]):
+        np.testing.assert_array_equal(region_mask.box_mask(LATS, LONS, box),
+                                      region_mask.box_mask(LATS, lons180, box))
+
+
+def test_full_circle_box():
+    mask = region_mask.box_mask(LATS, LONS, [0, 50, 360, 80])
+    assert mask[(LATS > 50) & (LATS < 80)].all()
+    assert not mask[(LATS < 50) | (LATS > 80)].any()
+
+
+def test_region_masks_match_box_mask():
+    boxes = [[210, 0, 250, 30], [335, -30, 15, 0], [0, 50, 360, 80]]
+    ocean = np.random.default_rng(0).random((len(LATS), len(LONS))) > 0.3
+    masks = region_mask.region_masks(LATS, LONS, boxes, ocean)
+    for mask, box in zip(masks, boxes):
+        np.testing.assert_array_equal(mask, region_mask.box_mask(LATS, LONS, box) & ocean)
+
+
+def test_first_wins():
+    masks = np.array([[1, 1, 0], [0, 1, 1], [1, 1, 1]], dtype=bool)
+    np.testing.assert_array_equal(region_mask.first_wins(masks),
+                                  [[1, 1, 0], [0, 0, 1], [0, 0, 0]])
+
+
+def test_ocean_weights():
+    land = np.array([[0.0, 0.25], [0.9, 1.0]])
+    np.testing.assert_array_equal(region_mask.ocean_weights(land), [[1, 0], [0, 0]])
+    np.testing.assert_allclose(region_mask.ocean_weights(land, 0.0), [[1, 0.75], [0.1, 0]])
+    np.testing.assert_allclose(region_mask.ocean_weights(land, 0.5), [[1, 0.75], [0, 0]])
+
+
+def test_neighbouring_boxes_share_no_points():
+    # A grid with points on every whole degree, so on the boxes' edges:
+    from regions import rs
+    lats = np.arange(-90., 91.)
+    lons = np.arange(0., 360.)
+    masks = region_mask.region_masks(lats, lons, rs)
+    # (Rn is masks[n - 1]) R5/R6 and R10/R11 at the meridian, R1/R2 at
+    # (250, 0), R1/R3 at 30N, R2/R4 at 30S, R12/R13 and R13/R16:
+    for a, b in [(5, 6), (10, 11), (1, 2), (1, 3), (2, 4), (12, 13), (13, 16), (5, 10)]:
+        assert not (masks[a - 1] & masks[b - 1]).any(), (a, b)
+    # R5 + R6 together cover [335, 15) across the meridian:
+    np.testing.assert_array_equal(masks[4] | masks[5],
+                                  region_mask.box_mask(lats, lons, [335, -30, 15, 0]))
+    assert masks[5][80, 0] and not masks[4][80, 0]
+
+
+def test_box_edges_are_half_open():
+    lats = np.array([-30., -10., 0., 90.])
+    lons = np.array([250., 270., 290.])
+    mask = region_mask.box_mask(lats, lons, [250, -30, 290, 0])
+    np.testing.assert_array_equal(mask, [[1, 1, 0], [1, 1, 0], [0, 0, 0], [0, 0, 0]])
+    # except at the pole:
+    assert region_mask.box_mask(lats, lons, [0, 50, 360, 90])[3].all()
+
+
+def test_box_points_match_box_mask():
+    ocean = np.random.default_rng(2).random((len(LATS), len(LONS))) > 0.3
+    for box in ([210, 0, 250, 30], [335, -30, 15, 0], [0, 50, 360, 80], [0, 80, 360, 90]):
+        mask = region_mask.box_mask(LATS, LONS, box)
+        np.testing.assert_array_equal(region_mask.box_points(LATS, LONS, box), np.flatnonzero(mask))
+        np.testing.assert_array_equal(region_mask.box_points(LATS, LONS, box, ocean),
+                                      np.flatnonzero(mask & ocean))
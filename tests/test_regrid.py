@@ -0,0 +1,78 @@
+import numpy as np
+
+import grid_cache
+import pp_template
+import rate_solver
+import regrid
+
+
+def _grid(nlat, nlon, lon0=0.0):
+    # An ENDGame-style grid: points half a box in from the poles.
+    dlat, dlon = 180. / nlat, 360. / nlon
+    return -90. + dlat * (np.arange(nlat) + 0.5), lon0 + dlon * (np.arange(nlon) + 0.5)
+
+
+N96 = _grid(144, 192)
+N216 = _grid(324, 432)
+
+
+def _total(lats, lons, field):
+    return rate_solver.total_tgyr(field, pp_template.area_weights(lats, lons))
+
+
+def test_global_total_is_kept():
+    field = np.random.default_rng(0).random((len(N96[0]), len(N96[1]))) * 1e-10
+    weights = regrid.make_weights(*N96, *N216)
+    out = regrid.regrid(weights, field)
+    assert out.shape == (len(N216[0]), len(N216[1]))
+    np.testing.assert_allclose(_total(*N216, out), _total(*N96, field), rtol=1e-12)
+    # ...and back again:
+    back = regrid.regrid(regrid.make_weights(*N216, *N96), out)
+    np.testing.assert_allclose(_total(*N96, back), _total(*N96, field), rtol=1e-12)
+
+
+def test_uniform_field_stays_uniform():
+    weights = regrid.make_weights(*N96, *N216)
+    np.testing.assert_allclose(np.bincount(weights.rows, weights.weights), 1.0, rtol=1e-12)
+    np.testing.assert_allclose(regrid.regrid(weights, np.full((144, 192), 3e-11)), 3e-11, rtol=1e-12)
+
+
+def test_longitudes_wrap():
+    # Target boxes centred on 0E straddle the source grid's 360E edge:
+    lats, lons = N96
+    target = _grid(144, 96, lon0=-360. / 96 / 2)
+    assert target[1][0] == 0.0
+    field = np.zeros((len(lats), len(lons)))
+    field[:, -1] = 1.0
+    out = regrid.regrid(regrid.make_weights(lats, lons, *target), field)
+    np.testing.assert_allclose(out[:, 0], 0.5, rtol=1e-12)
+    assert not out[:, 1:].any()
+    np.testing.assert_allclose(_total(*target, out), _total(lats, lons, field), rtol=1e-12)
+    # The same with the target's longitudes running from -180:
+    out180 = regrid.regrid(regrid.make_weights(lats, lons, target[0], target[1] - 180), field)
+    np.testing.assert_allclose(out180, np.roll(out, -48, axis=1), rtol=1e-12, atol=1e-14)
+
+
+def test_regrid_stack():
+    stack = np.random.default_rng(1).random((3, 144, 192))
+    weights = regrid.make_weights(*N96, *N216)
+    out = regrid.regrid(weights, stack)
+    np.testing.assert_array_equal(out[1], regrid.regrid(weights, stack[1]))
+
+
+def test_cached_weights_match_make_weights(tmp_path, monkeypatch):
+    made = regrid.make_weights(*N96, *N216)
+    cached = regrid.cached_weights(str(tmp_path), *N96, *N216)
+    assert len(list(tmp_path.iterdir())) == 1
+    # The second time they're read back without being worked out:
+    monkeypatch.setattr(regrid, 'make_weights', None)
+    again = regrid.cached_weights(str(tmp_path), *N96, *N216)
+    for weights in (cached, again):
+        assert (weights.src_shape, weights.tgt_shape) == (made.src_shape, made.tgt_shape)
+        for name in ('rows', 'cols', 'weights', 'indptr'):
+            np.testing.assert_array_equal(getattr(weights, name), getattr(made, name))
+    # Another target grid gets its own entry:
+    monkeypatch.undo()
+    regrid.cached_weights(str(tmp_path), *N96, *_grid(144, 192, lon0=1.0))
+    assert len(list(tmp_path.iterdir())) == 2
+    assert grid_cache.cache_path(str(tmp_path), [*N96, *N216]) in [str(p) for p in tmp_path.iterdir()]
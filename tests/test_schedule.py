@@ -0,0 +1,15 @@
+import numpy as np
+
+import schedule
+
+
+def test_each_year_totals_its_ramp_factor():
+    months = np.tile(np.r_[12, 1:12], 5)   # Dec-Nov, as the template
+    seasonal = [1, 1, 2, 3, 4, 4, 4, 3, 2, 1, 1, 1]
+    factors = schedule.time_factors(months, 2, seasonal, (0.0, 2.0))
+    yearly = factors.reshape(5, 12, 2).mean(axis=1)
+    np.testing.assert_allclose(yearly, np.repeat(schedule.ramp_factors(5, 0.0, 2.0)[:, None], 2, axis=1))
+
+
+def test_seasonal_factors():
+    np.testing.assert_allclose(schedule.seasonal_factors(np.arange(1, 13)).mean(), 1.0)
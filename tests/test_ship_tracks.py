@@ -0,0 +1,60 @@
+import numpy as np
+
+import pp_template
+import ship_tracks
+from rate_solver import SECS_PER_YEAR
+
+LATS = np.arange(-88.75, 90., 2.5)
+LONS = np.arange(1.25, 360., 2.5)
+
+
+def _deployment(start, end, rate=1.0, interval=3600.):
+    time = np.arange(np.datetime64(start), np.datetime64(end), np.timedelta64(int(interval), 's'))
+    n = len(time)
+    return time, np.full(n, -20.5), np.full(n, -84.75), np.full(n, rate * interval)
+
+
+def _annual_total(chunks):
+    mass, sampled, dropped = ship_tracks.grid_tracks(chunks, LATS, LONS)
+    areas = pp_template.area_weights(LATS, LONS)
+    flux = ship_tracks.monthly_flux(mass, areas, ship_tracks.month_years(sampled))
+    return np.sum(flux * areas) * SECS_PER_YEAR / 12., sampled, dropped
+
+
+def test_deployment_across_new_year():
+    # July 2040 to June 2041 at 1 kg/s is one year's spraying:
+    chunk = _deployment('2040-07-01T00:00', '2041-07-01T00:00')
+    total, sampled, dropped = _annual_total([chunk])
+    assert np.isclose(total, chunk[3].sum())
+    assert np.isclose(total, 365 * 86400.)
+    assert len(sampled) == 12 and dropped == 0
+    np.testing.assert_array_equal(ship_tracks.month_years(sampled), np.ones(12))
+
+
+def test_several_years_give_mean_year():
+    # Two years, in two chunks, at 1 and 3 kg/s: the mean year is 2 kg/s.
+    chunks = [_deployment('2040-01-01T00:00', '2041-01-01T00:00', 1.0),
+              _deployment('2041-01-01T00:00', '2042-01-01T00:00', 3.0)]
+    total, sampled, _ = _annual_total(chunks)
+    assert np.isclose(total, (chunks[0][3].sum() + chunks[1][3].sum()) / 2)
+    np.testing.assert_array_equal(ship_tracks.month_years(sampled), np.full(12, 2))
+
+
+def test_cells_and_wrapping():
+    cells = ship_tracks.cell_indices(LATS, LONS, np.array([-20.5, -20.5, 95.]),
+                                     np.array([275.25, -84.75, 10.]))
+    assert cells[0] == cells[1] >= 0
+    assert cells[2] == -1
+    assert abs(LATS[cells[0] // len(LONS)] + 20.5) <= 1.25
+    assert abs(LONS[cells[0] % len(LONS)] - 275.25) <= 1.25
+
+
+def test_read_tracks_in_chunks(tmp_path):
+    path = tmp_path / 'tracks.csv'
+    path.write_text('time,lat,lon,rate\n'
+                    '2040-01-01T00:00,-20.5,275.25,12.0\n'
+                    '2040-01-01T01:00,-20.6,275.40,12.0\n'
+                    '2040-02-01T00:00,10.0,5.0,2.0\n')
+    chunks = list(ship_tracks.read_tracks(str(path), chunksize=2, interval=600.))
+    assert [len(c[0]) for c in chunks] == [2, 1]
+    np.testing.assert_allclose(np.concatenate([c[3] for c in chunks]), [7200., 7200., 1200.])
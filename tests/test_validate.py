@@ -0,0 +1,19 @@
+import validate
+
+
+def test_matching_files(ancils):
+    ok, stats, problems = validate.validate('NO_50Tg_MCB.pp', 'NO_50Tg_MCB.pp', [16])
+    assert ok and len(stats) == 12 and not problems
+
+
+def test_different_files(ancils):
+    ok, _, problems = validate.validate('SEP_50Tg_MCB.pp', 'NO_50Tg_MCB.pp')
+    assert not ok and problems
+
+
+def test_missing_reference(ancils, tmp_path, capsys):
+    missing = str(tmp_path / 'missing.pp')
+    ok, stats, problems = validate.validate('NO_50Tg_MCB.pp', missing)
+    assert not ok and stats == [] and problems == [missing + ': no such file']
+    assert validate.main(['NO_50Tg_MCB.pp', missing]) == 1
+    assert 'DOES NOT MATCH' in capsys.readouterr().out
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+import mcb_ancil
+import pp_template
+import wgdos
+
+
+def test_round_trip_within_accuracy():
+    rng = np.random.default_rng(7)
+    data = rng.random((20, 30)) * 1e-9
+    data[3] = 0.0
+    data[5, :10] = 0.0
+    acc = wgdos.accuracy(data)
+    words = wgdos.pack(data, acc)
+    assert len(words) % 2 == 0 and words[0] <= len(words)
+    back = wgdos.unpack(words)
+    assert np.all(np.abs(back - data) <= 2.0**(acc - 1))
+    assert np.all(back[3] == 0) and np.all(back[5, :10] == 0)
+
+
+def test_accuracy_default():
+    assert wgdos.accuracy(np.array([1.0])) == 1 - 24
+    assert wgdos.accuracy(np.zeros(3)) == 0
+
+
+def test_negative_values():
+    data = np.linspace(-5.0, 3.0, 48).reshape(4, 12)
+    acc = wgdos.accuracy(data, 16)
+    assert np.all(np.abs(wgdos.unpack(wgdos.pack(data, acc)) - data) <= 2.0**(acc - 1))
+
+
+def test_repacks_template_exactly(ancils):
+    ints, reals, offsets, _ = pp_template.read_lookups(mcb_ancil.INFILE)
+    words = np.memmap(mcb_ancil.INFILE, dtype='>u4', mode='r')
+    raw = np.array(words[offsets[0]:offsets[0] + ints[0, pp_template.LBLREC]])
+    packed = wgdos.pack(wgdos.unpack(raw), int(reals[0, pp_template.BACC]))
+    # (all but the padding word, which the template leaves as it was in memory)
+    assert len(packed) == len(raw)
+    np.testing.assert_array_equal(packed[:raw[0]], raw[:raw[0]])
+
+
+def test_packed_pp_file_is_lossless(ancils, tmp_path):
+    expected = pp_template.load_field('NO_50Tg_MCB.pp')
+    template = pp_template.load_template(mcb_ancil.INFILE)
+    path = str(tmp_path / 'packed.pp')
+    pp_template.save_pp(template, np.array(expected, dtype='f8'), path, wgdos_bits=24)
+    for ints, reals, data in pp_template.iter_fields(path):
+        assert ints[pp_template.LBPACK] == wgdos.LBPACK_WGDOS
+        np.testing.assert_array_equal(data.astype('f4'), expected)
+
+
+def test_not_finite():
+    with pytest.raises(ValueError):
+        wgdos.pack(np.array([[1.0, np.nan]]), -10)
+
+
+def test_wgdos_only_for_pp(ancils, tmp_path):
+    grid = mcb_ancil.load_grid()
+    with pytest.raises(ValueError):
+        mcb_ancil.write_ancil(grid, np.zeros(grid.grid_areas.shape), str(tmp_path / 'x.nc'), wgdos_bits=24)
+
+
+def test_mixed_rates_are_within_the_bound_but_not_exact(ancils):
+    # Regions at different rates: 24 bits of the largest value isn't
+    # every bit of the smaller ones.
+    grid = mcb_ancil.load_grid()
+    field = mcb_ancil.compute_field(mcb_ancil.build_regions(grid, [1, 2, 3]), [1, 20, 5]).astype('f4')
+    acc = wgdos.accuracy(field)
+    back = wgdos.unpack(wgdos.pack(field, acc))
+    assert np.all(np.abs(back - field) <= 2.0**(acc - 1))
+    assert np.abs(back - field).max() <= 2.0**-23 * field.max()
+    assert np.any(back.astype('f4') != field)